@@ -0,0 +1,203 @@
+import queue
+import random
+import time
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from game import SnakeGameAI
+from model import Linear_QNet
+from agent import Agent, save_results
+from metrics import RunningStats, MetricsLog, read_log, plot_in_background
+
+
+def actor(actor_id, shared_model, version, lock, n_games, transitions, stop, released, chunk_size, seed):
+    """
+    Play games with a local copy of the learner's network and stream the transitions to the learner in chunks.
+    The local copy is refreshed from shared_model whenever the learner bumps version.
+    The chunk that ends a game carries its (score, frames), so the learner counts a game only once it has trained on
+    all of its transitions.
+    Chunks are tensors shared through file descriptors, which can only be received while this process is alive, so on
+    stop the actor sends a final None chunk and waits for released before exiting.
+    :param actor_id: int
+    :param shared_model: Linear_QNet() in shared memory
+    :param version: mp.Value, incremented by the learner after each broadcast
+    :param lock: mp.Lock, guards shared_model
+    :param n_games: mp.Value, games finished by all actors, drives the exploration schedule
+    :param transitions: mp.Queue of (actor_id, tuple[Tensor, ...], tuple[int, int] of score and frames or None)
+    :param stop: mp.Event
+    :param released: mp.Event, set by the learner once it has received every actor's final chunk
+    :param chunk_size: int
+    :param seed: int
+    """
+    torch.set_num_threads(1)
+    random.seed(seed)
+    torch.manual_seed(seed)
+
+    model = Linear_QNet(11, 256, 3)
+    local_version = -1
+    game = SnakeGameAI()
+
+    states = np.zeros((chunk_size, 11), dtype=np.float32)
+    actions = np.zeros(chunk_size, dtype=np.int64)
+    rewards = np.zeros(chunk_size, dtype=np.float32)
+    next_states = np.zeros((chunk_size, 11), dtype=np.float32)
+    dones = np.zeros(chunk_size, dtype=bool)
+    filled = 0
+
+    while not stop.is_set():
+        if version.value != local_version:
+            with lock:
+                local_version = version.value
+                model.load_state_dict(shared_model.state_dict())
+
+        state_old = Agent.get_state(game)
+
+        # same exploration schedule as Agent.get_action, on the number of games played by all actors
+        if random.randint(0, 200) < 80 - n_games.value:
+            move = random.randint(0, 2)
+        else:
+            with torch.no_grad():
+                move = torch.argmax(model(torch.tensor(state_old, dtype=torch.float))).item()
+        final_move = [0, 0, 0]
+        final_move[move] = 1
+
+        reward, done, score = game.play_step(final_move)
+        states[filled] = state_old
+        actions[filled] = move
+        rewards[filled] = reward
+        next_states[filled] = Agent.get_state(game)
+        dones[filled] = done
+        filled += 1
+
+        if filled == chunk_size or done:
+            chunk = tuple(torch.from_numpy(a[:filled].copy()) for a in (states, actions, rewards, next_states, dones))
+            _put(transitions, (actor_id, chunk, (score, game.frame_iteration) if done else None), stop)
+            filled = 0
+        if done:
+            game.reset()
+
+    transitions.put((actor_id, None, None))
+    released.wait()
+
+
+def _put(q, item, stop):
+    """
+    Put item on q without blocking forever once the learner has asked the actors to stop
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def train_distributed(n_games=250, n_actors=4, sync_interval=50, chunk_size=64, queue_size=256, seed=0):
+    """
+    Actor-learner training: n_actors processes each run a SnakeGameAI and a copy of Linear_QNet and send their
+    transitions through shared-memory queues to this process, which trains the Agent's QTrainer on every chunk
+    (short memory) and on a replay sample after every finished game (long memory). Updated weights are broadcast to
+    the actors every sync_interval chunk updates. Writes the same results file as agent.train().
+    Adding actors only helps while the learner keeps up: the share of time it spent idle, waiting for chunks, is
+    printed at the end, and near 0% means the learner is the bottleneck.
+    :param n_games: int
+    :param n_actors: int
+    :param sync_interval: int
+    :param chunk_size: int, transitions per message from an actor
+    :param queue_size: int, chunks that may wait for the learner
+    :param seed: int
+    :return: Agent(), with the metrics.RunningStats() of the run as agent.stats
+    """
+    ctx = mp.get_context('spawn')
+    agent = Agent()
+    stats = RunningStats()
+    agent.stats = stats
+    shared_model = Linear_QNet(11, 256, 3)
+    shared_model.load_state_dict(agent.model.state_dict())
+    shared_model.share_memory()
+    version = ctx.Value('i', 0)
+    games_played = ctx.Value('i', 0)
+    lock = ctx.Lock()
+    transitions = ctx.Queue(queue_size)
+    stop = ctx.Event()
+    released = ctx.Event()
+
+    actors = [ctx.Process(target=actor, daemon=True,
+                          args=(i, shared_model, version, lock, games_played, transitions, stop, released,
+                                chunk_size, seed + i))
+              for i in range(n_actors)]
+    for p in actors:
+        p.start()
+
+    title = f'Combined Model {n_games} epochs {n_actors} actors'
+    log = MetricsLog(f'results/{title}.csv')
+    n_transitions = 0
+    updates = 0
+    waiting = 0.0
+    start = time.perf_counter()
+
+    while agent.n_games < n_games:
+        t = time.perf_counter()
+        try:
+            _, chunk, episode = transitions.get(timeout=1)
+        except queue.Empty:
+            exitcodes = [p.exitcode for p in actors if p.exitcode is not None]
+            if exitcodes:
+                stop.set()
+                raise RuntimeError(f'an actor exited with code {exitcodes[0]} before training finished')
+            continue
+        finally:
+            waiting += time.perf_counter() - t
+        if chunk is None:
+            raise RuntimeError('an actor stopped before training finished')
+
+        # train short memory on the whole chunk, then remember it
+        agent.trainer.train_batch(*chunk)
+        agent.memory.extend(*chunk)
+        n_transitions += len(chunk[1])
+        updates += 1
+        if updates % sync_interval == 0:
+            with lock:
+                shared_model.load_state_dict(agent.model.state_dict())
+                version.value += 1
+
+        if episode is not None:
+            # the game is over and every one of its transitions has been trained on
+            score, frames = episode
+            agent.n_games += 1
+            games_played.value = agent.n_games
+            agent.train_long_memory()
+
+            if stats.add(score, frames):
+                agent.model.save()
+            log.log(agent.n_games, score, stats.mean_score, stats.record, frames)
+
+    elapsed = time.perf_counter() - start
+    stop.set()
+    finished = 0
+    while finished < n_actors:
+        finished += transitions.get()[1] is None
+    released.set()
+    for p in actors:
+        p.join()
+
+    print(f'{n_transitions} transitions from {n_actors} actors in {elapsed:.1f} s '
+          f'({n_transitions / elapsed:.0f} transitions/s), learner idle {waiting / elapsed:.0%} of the time')
+    agent.model.save()
+    log.close()
+    scores, _ = read_log(log.path)
+    save_results(title, stats.n_games, stats.record, stats.mean_score, stats.max_iteration, stats.avg_iteration,
+                 scores)
+    plot_in_background(log.path, title)
+    return agent
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Train with several actor processes and one learner')
+    parser.add_argument('--games', type=int, default=250)
+    parser.add_argument('--actors', type=int, default=4)
+    parser.add_argument('--sync-interval', type=int, default=50)
+    args = parser.parse_args()
+    train_distributed(args.games, args.actors, args.sync_interval)
@@ -1,35 +1,87 @@
-import math
-
-import torch
 import random
 import numpy as np
-from collections import deque
-from game import SnakeGameAI, Direction, Point
-from model import Linear_QNet, QTrainer
-from helper import plot
+import torch
+from game import Direction, Point
+from model import Linear_QNet, ConvQNet, QTrainer, inference_policy
+from replay_memory import ReplayMemory, PrioritizedReplayMemory
+from profiling import NullProfiler
+from metrics import RunningStats, MetricsLog, read_log, plot_in_background
+from checkpoint import CheckpointManager, load_checkpoint, restore
+from state_encoder import STATE_SIZE, GRID_CHANNELS, encode_state, encode_grid
+from trajectory import TrajectoryRecorder
+from scheduler import UpdateScheduler
+from game_kernel import ENGINES, make_game
 
 MAX_MEMORY = 100_000
+GRID_MAX_MEMORY = 20_000  # a grid state takes 5376 bytes on a 24x32 board
 BATCH_SIZE = 1000
 LR = 0.001
 
 
 class Agent:
 
-    def __init__(self, model=Linear_QNet(11, 256, 3)):
+    def __init__(self, model=None, prioritized=False, inference='torch', seed=None, lr=LR, batch_size=BATCH_SIZE,
+                 max_memory=None, gamma=0.5, epsilon_start=80, update_every=1, n_step=1, training_gap=True,
+                 observation='features', board=(24, 32)):
         """
-        Initializes hyperparameters, memory deque, model and trainer
+        Initializes hyperparameters, replay memory, model and trainer
+        :param model: Linear_QNet(), a new Linear_QNet(11, 256, 3) or ConvQNet if None
+        :param prioritized: bool, sample long memory by TD error instead of uniformly
+        :param inference: str, backend of get_action, see model.inference_policy()
+        :param seed: int, seed of the replay memory sampling
+        :param lr: float
+        :param batch_size: int, transitions per long memory update
+        :param max_memory: int, capacity of the replay memory, MAX_MEMORY or GRID_MAX_MEMORY if None
+        :param gamma: float, discount rate
+        :param epsilon_start: int, random moves stop after this many games
+        :param update_every: int, frames between short memory updates, see scheduler.UpdateScheduler
+        :param n_step: int, train short memory on n-step returns
+        :param training_gap: bool, do not train short memory on the frames right after the snake eats
+        :param observation: str, 'features' for the 11 values of get_state() or 'grid' for the board planes of
+        state_encoder.encode_grid()
+        :param board: tuple[int, int], rows and columns of the board, for the grid observation
         """
         self.n_games = 0
         self.epsilon = 0  # randomness
-        self.gamma = 0.5  # discount rate
-        self.memory = deque(maxlen=MAX_MEMORY)  # popleft()
+        self.epsilon_start = epsilon_start
+        self.gamma = gamma  # discount rate
+        self.batch_size = batch_size
+        self.prioritized = prioritized
+        self.observation = observation
+        if observation == 'features':
+            self.state_shape = (STATE_SIZE,)
+            state_dtype = np.float32
+            max_memory = MAX_MEMORY if max_memory is None else max_memory
+        elif observation == 'grid':
+            self.state_shape = (GRID_CHANNELS,) + tuple(board)
+            state_dtype = np.uint8  # the planes only hold 0 and 1
+            max_memory = GRID_MAX_MEMORY if max_memory is None else max_memory
+        else:
+            raise ValueError(f'unknown observation {observation!r}')
+        memory = PrioritizedReplayMemory if prioritized else ReplayMemory
+        # overwrites the oldest transition when full
+        self.memory = memory(max_memory, self.state_shape, state_dtype=state_dtype, seed=seed)
+        if model is None:
+            model = Linear_QNet(11, 256, 3) if observation == 'features' else ConvQNet(*self.state_shape)
         self.model = model
-        self.trainer = QTrainer(self.model, lr=LR, gamma=self.gamma)
+        self.trainer = QTrainer(self.model, lr=lr, gamma=self.gamma)
+        self.scheduler = UpdateScheduler(self.trainer, self.state_shape, update_every, n_step, self.gamma,
+                                         training_gap)
+        self.last_score = 0
+        self.set_inference(inference)
+
+    def set_inference(self, backend):
+        """
+        Select how get_action evaluates the model. Call again after replacing self.model.
+        :param backend: str, 'torch', 'script' or 'numpy'
+        """
+        self.policy = inference_policy(self.model, backend)
 
     @staticmethod
     def get_state(game):
         """
         Get current state of game instance.
+        The reference for state_encoder.encode_state(), which train() uses to write states into reused buffers.
         :param game: SnakeGameAI()
         :return: ndarray
         """
@@ -49,22 +101,22 @@ class Agent:
 
         state = [
             # Danger straight
-            (dir_r and game.is_collision(point_r)) or
-            (dir_l and game.is_collision(point_l)) or
-            (dir_u and game.is_collision(point_u)) or
-            (dir_d and game.is_collision(point_d)),
+            (dir_r and game.is_blocked(point_r)) or
+            (dir_l and game.is_blocked(point_l)) or
+            (dir_u and game.is_blocked(point_u)) or
+            (dir_d and game.is_blocked(point_d)),
 
             # Danger right
-            (dir_u and game.is_collision(point_r)) or
-            (dir_d and game.is_collision(point_l)) or
-            (dir_l and game.is_collision(point_u)) or
-            (dir_r and game.is_collision(point_d)),
+            (dir_u and game.is_blocked(point_r)) or
+            (dir_d and game.is_blocked(point_l)) or
+            (dir_l and game.is_blocked(point_u)) or
+            (dir_r and game.is_blocked(point_d)),
 
             # Danger left
-            (dir_d and game.is_collision(point_r)) or
-            (dir_u and game.is_collision(point_l)) or
-            (dir_r and game.is_collision(point_u)) or
-            (dir_l and game.is_collision(point_d)),
+            (dir_d and game.is_blocked(point_r)) or
+            (dir_u and game.is_blocked(point_l)) or
+            (dir_r and game.is_blocked(point_u)) or
+            (dir_l and game.is_blocked(point_d)),
 
             # Move direction
             dir_l,
@@ -81,30 +133,42 @@ class Agent:
 
         return np.array(state, dtype=int)
 
+    def encode(self, game, out):
+        """
+        Write the observation of game into out, without allocating
+        :param game: SnakeGameAI()
+        :param out: ndarray[float32] of shape self.state_shape
+        :return: out
+        """
+        if self.observation == 'grid':
+            return encode_grid(game, out)
+        return encode_state(game, out)
+
     def remember(self, state, action, reward, next_state, done):
         """
-        Store old state, new state and corresponding game results in memory deque
+        Store old state, new state and corresponding game results in replay memory
         :param state: ndarray
         :param action: list[int]
         :param reward: int
         :param next_state: ndarray
         :param done: bool
         """
-        self.memory.append((state, action, reward, next_state, done))  # popleft if MAX_MEMORY is reached
+        self.memory.append(state, action, reward, next_state, done)
 
     def train_long_memory(self):
         # Train based on a sample of memory that is batch size, or on full memory if memory is less than batch size.
-        if len(self.memory) > BATCH_SIZE:
-            mini_sample = random.sample(self.memory, BATCH_SIZE)  # list of tuples
+        if self.prioritized:
+            batch, idx, weights = self.memory.sample_weighted(self.batch_size)
+            td_errors = self.trainer.train_batch(*batch, weights=weights)
+            self.memory.update_priorities(idx, td_errors)
         else:
-            mini_sample = self.memory
-
-        states, actions, rewards, next_states, dones = zip(*mini_sample)
-        self.trainer.train_step(states, actions, rewards, next_states, dones)
+            states, actions, rewards, next_states, dones = self.memory.sample(self.batch_size)
+            self.trainer.train_batch(states, actions, rewards, next_states, dones)
 
     def train_short_memory(self, game, state, action, reward, next_state, done):
         """
-        Train based on the single instance represented by the given parameters
+        Hand one transition to the update scheduler, which trains on the buffered transitions every few frames and at
+        the end of the game
         :param game: SnakeGameAI()
         :param state: ndarray
         :param action: list[int]
@@ -112,22 +176,9 @@ class Agent:
         :param next_state: ndarray
         :param done: bool
         """
-        release_frame = 0
-        if reward == 10:
-            frame_number = game.frame_iteration
-            length = game.length
-            if length <= 10:
-                m = 6
-            else:
-                m = math.floor(0.6 * length + 2)
-            y = False
-            release_frame = frame_number + m
-            self.trainer.train_step(state, action, reward, next_state, done)
-        else:
-            if game.frame_iteration >= release_frame:
-                y = True
-            if y:
-                self.trainer.train_step(state, action, reward, next_state, done)
+        ate = game.score > self.last_score
+        self.last_score = 0 if done else game.score
+        self.scheduler.push(state, action, reward, next_state, done, ate, len(game.snake))
 
     def get_action(self, state):
         """
@@ -137,73 +188,237 @@ class Agent:
         :return: list[int]
         """
         # random moves: tradeoff exploration / exploitation
-        self.epsilon = 80 - self.n_games
+        self.epsilon = self.epsilon_start - self.n_games
         final_move = [0, 0, 0]
         if random.randint(0, 200) < self.epsilon:
             move = random.randint(0, 2)
             final_move[move] = 1
         else:
-            state0 = torch.tensor(state, dtype=torch.float)
-            prediction = self.model(state0)
-            move = torch.argmax(prediction).item()
+            move = self.policy(state)
             final_move[move] = 1
 
         return final_move
 
 
-def train(n_games=250):
-    plot_scores = []
-    plot_mean_scores = []
-    total_score = 0
-    record = 0
-    agent = Agent()
+def save_results(title, n_games, record, mean_score, max_iteration, avg_iteration, scores):
+    """
+    Write the results of a training run to results/<title>.txt: number of games, record, mean score, max and average
+    frames per game, then the comma separated scores
+    :param title: str
+    :param n_games: int
+    :param record: int
+    :param mean_score: float
+    :param max_iteration: int
+    :param avg_iteration: float
+    :param scores: list[int]
+    """
+    with open(f'results/{title}.txt', 'w') as f:
+        f.write(f'{n_games}\n{record}\n{mean_score}\n{max_iteration}\n{avg_iteration}\n')
+        f.write(",".join([str(i) for i in scores]))
+
+
+def seed_everything(seed):
+    """
+    Seed the random, NumPy and torch generators used by the game, the agent and the trainer
+    :param seed: int
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def train(n_games=250, n_actors=0, sync_interval=50, seed=None, save=True, profiler=None, checkpoints=None,
+          resume=None, hyperparameters=None, rewards=None, trajectories=None, engine='auto'):
+    """
+    Train an agent for n_games and save its results.
+    With n_actors > 0, games are played by that many actor processes feeding one learner, see actor_learner.py. That
+    mode always saves its results and only takes n_games, sync_interval and seed.
+    :param n_games: int
+    :param n_actors: int
+    :param sync_interval: int, learner updates between weight broadcasts to the actors
+    :param seed: int, makes the run reproducible
+    :param save: bool, save the model on each record, log every game to results/<title>.csv and write the results
+    file and plot at the end
+    :param profiler: profiling.TrainingProfiler() to time each phase of the loop, or None
+    :param checkpoints: checkpoint.CheckpointManager() that writes the models and full training checkpoints, a default
+    one if None and save
+    :param resume: str, checkpoint to continue training from
+    :param hyperparameters: dict of keyword arguments of Agent(), e.g. lr, batch_size, max_memory, gamma, epsilon_start
+    :param rewards: dict, overrides of game.REWARDS
+    :param trajectories: str, record every game to this trajectory file. Each game then gets its own seed, drawn from
+    a generator seeded with seed, so the food no longer comes from the global random module
+    :param engine: str, game engine, see game_kernel.make_game(). All engines play the same games.
+    :return: Agent(), with the metrics.RunningStats() of the run as agent.stats
+    """
+    if n_actors > 0:
+        from actor_learner import train_distributed
+
+        unsupported = {'profiler': profiler, 'checkpoints': checkpoints, 'resume': resume,
+                       'hyperparameters': hyperparameters, 'rewards': rewards, 'trajectories': trajectories}
+        unsupported = [name for name, value in unsupported.items() if value is not None]
+        if not save:
+            unsupported.append('save')
+        if engine != 'auto':
+            unsupported.append('engine')
+        if unsupported:
+            raise ValueError(f"n_actors > 0 does not support {', '.join(unsupported)}")
+        return train_distributed(n_games, n_actors, sync_interval=sync_interval, seed=0 if seed is None else seed)
+
+    if seed is not None:
+        seed_everything(seed)
+    prof = profiler if profiler is not None else NullProfiler()
+
+    if save and checkpoints is None:
+        checkpoints = CheckpointManager()
+
+    title = f'Combined Model {n_games} epochs'
+    stats = RunningStats()
     # game = SnakeGameAI(visual=True, speed=10) # standard
-    game = SnakeGameAI() #
+    recorder = episode_seeds = None
+    if trajectories is not None:
+        episode_seeds = random.Random(seed)
+        game = make_game(rewards=rewards, seed=episode_seeds.getrandbits(63), engine=engine)
+    else:
+        game = make_game(rewards=rewards, engine=engine)
+    agent = Agent(seed=seed, board=(game.rows, game.cols), **(hyperparameters or {}))
+    agent.stats = stats
+    if resume is not None:
+        # with trajectories, this also restores the seed of the current game and of the games after it
+        restore(load_checkpoint(resume), agent, game, stats, episode_seeds)
+    if trajectories is not None:
+        # a resumed run continues the file, keeping the games recorded before its checkpoint
+        recorder = TrajectoryRecorder(trajectories, rewards, agent.n_games, resume=resume is not None)
+        recorder.begin(game)
+    log = MetricsLog(f'results/{title}.csv', resume_from=agent.n_games) if save else None
+    # the states are written into two reused buffers, everything that keeps a state copies it
+    state_buffers = np.zeros((2,) + agent.state_shape, dtype=np.float32)
+    prof.mark()
     while True:
         # get old state
-        state_old = agent.get_state(game)
+        state_old = agent.encode(game, state_buffers[0])
+        prof.lap('state')
 
         # get move
         final_move = agent.get_action(state_old)
+        prof.lap('action')
 
         # perform move and get new state
         reward, done, score = game.play_step(final_move)
-        state_new = agent.get_state(game)
+        if recorder is not None:
+            recorder.record(final_move, reward)
+        prof.lap('step')
+        state_new = agent.encode(game, state_buffers[1])
+        prof.lap('state')
 
         # train short memory
         agent.train_short_memory(game, state_old, final_move, reward, state_new, done)
+        prof.lap('short_memory')
 
         # remember
         agent.remember(state_old, final_move, reward, state_new, done)
+        prof.lap('remember')
+        prof.count('frames')
 
         if done:
-            # train long memory, plot result
-            game.reset()
+            # train long memory, log result
+            frames = game.frame_iteration
+            if recorder is not None:
+                recorder.end(score)
+                game.reset(episode_seeds.getrandbits(63))
+                recorder.begin(game)
+            else:
+                game.reset()
+            prof.lap('step')
             agent.n_games += 1
             agent.train_long_memory()
-
-            if score > record:
-                record = score
-                agent.model.save()
-
-            plot_scores.append(score)
-            total_score += score
-            mean_score = total_score / agent.n_games
-
-            plot_mean_scores.append(mean_score)
-
-            if agent.n_games == n_games:
-                agent.model.save()
-                title = f'Combined Model {n_games} epochs'
-                f = open(f'results/{title}.txt', 'w')
-                f.write(
-                    f'{agent.n_games}\n{record}\n{mean_score}\n{game.max_iteration}\n'
-                    f'{game.total_iteration / agent.n_games}\n')
-                f.write(",".join([str(i) for i in plot_scores]))
-                f.close()
-                plot(plot_scores, plot_mean_scores, title)
+            prof.lap('long_memory')
+            prof.count('train_steps')
+            prof.count('samples', min(len(agent.memory), agent.batch_size))
+
+            if stats.add(score, frames):
+                if checkpoints is not None:
+                    checkpoints.save_model(agent.model)
+                prof.lap('checkpoint')
+
+            if log is not None:
+                log.log(agent.n_games, score, stats.mean_score, stats.record, frames)
+                prof.lap('metrics')
+            if checkpoints is not None and agent.n_games % checkpoints.every == 0:
+                checkpoints.save(agent, game, stats, episode_seeds)
+                prof.lap('checkpoint')
+            prof.end_episode()
+
+            if agent.n_games >= n_games:
+                if checkpoints is not None:
+                    checkpoints.save_model(agent.model)
+                    checkpoints.close()
+                    prof.lap('checkpoint')
+                if recorder is not None:
+                    recorder.close()
+                if save:
+                    log.close()
+                    scores, _ = read_log(log.path)
+                    save_results(title, stats.n_games, stats.record, stats.mean_score, stats.max_iteration,
+                                 stats.avg_iteration, scores)
+                    plot_in_background(log.path, title)
+                    prof.lap('plot')
+                prof.close()
                 return agent
 
 
+def load_agent(path, **kwargs):
+    """
+    Build an Agent from a checkpoint written by CheckpointManager, with its model, Adam state, replay memory and game
+    count, or from the weights written by Linear_QNet.save(). An agent loaded from weights alone counts as past its
+    exploration games, so it plays greedily.
+    :param path: str
+    :param kwargs: keyword arguments of Agent(), the model, observation and replay mode follow from the file
+    :return: Agent()
+    """
+    state = load_checkpoint(path)
+    weights = state['model'] if 'model' in state else state
+    if 'conv1.weight' in weights:
+        kwargs.setdefault('observation', 'grid')
+    else:
+        hidden_size, input_size = weights['linear1.weight'].shape
+        kwargs.setdefault('model', Linear_QNet(input_size, hidden_size, weights['linear2.weight'].shape[0]))
+    if 'tree' in state.get('memory', {}):
+        kwargs.setdefault('prioritized', True)
+    agent = Agent(**kwargs)
+    if 'model' in state:
+        restore(state, agent)
+    else:
+        agent.model.load_state_dict(weights)
+        agent.n_games = agent.epsilon_start
+    return agent
+
+
 if __name__ == '__main__':
-    train()
\ No newline at end of file
+    import argparse
+    from profiling import TrainingProfiler
+
+    parser = argparse.ArgumentParser(description='Train an agent')
+    parser.add_argument('--games', type=int, default=250)
+    parser.add_argument('--actors', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--resume', help="checkpoint to continue from, or 'latest'")
+    parser.add_argument('--checkpoint-every', type=int, default=25, help='games between checkpoints')
+    parser.add_argument('--keep', type=int, default=3, help='checkpoints to keep')
+    parser.add_argument('--no-memory', action='store_true', help='leave the replay memory out of checkpoints')
+    parser.add_argument('--record', help='trajectory file to record every game to, see trajectory.py')
+    parser.add_argument('--profile', help='JSON lines file for per-phase timings')
+    parser.add_argument('--profile-episodes', type=int, nargs=2, metavar=('FIRST', 'LAST'),
+                        help='also run a profiler over these episodes')
+    parser.add_argument('--profiler', choices=['cprofile', 'torch'], default='cprofile')
+    parser.add_argument('--engine', choices=ENGINES, default='auto', help='game engine, numba if installed by default')
+    args = parser.parse_args()
+
+    profiler = None
+    if args.profile:
+        profiler = TrainingProfiler(args.profile, profile_episodes=args.profile_episodes, profiler=args.profiler)
+    checkpoints = None
+    if not args.actors:
+        checkpoints = CheckpointManager(keep=args.keep, every=args.checkpoint_every, include_memory=not args.no_memory)
+    resume = checkpoints.latest() if args.resume == 'latest' and checkpoints is not None else args.resume
+    train(args.games, n_actors=args.actors, seed=args.seed, profiler=profiler, checkpoints=checkpoints, resume=resume,
+          trajectories=args.record, engine=args.engine)
\ No newline at end of file
@@ -0,0 +1,166 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import numpy as np
+import torch
+from game import SnakeGameAI, Point, BLOCK_SIZE
+from agent import Agent, train, seed_everything
+from state_encoder import STATE_SIZE, StateEncoder, encode_state
+from vec_game import VecSnakeGame
+from game_kernel import HAVE_NUMBA, CompiledSnakeGame
+
+MOVES = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+
+
+def measure(fn, repeat=100, number=10, warmup=10):
+    """
+    Time fn: warmup untimed calls, then repeat samples of number calls each
+    :param fn: function without arguments
+    :param repeat: int
+    :param number: int
+    :param warmup: int
+    :return: dict of per-call seconds: mean, min, p50, p90, p99 and max over the samples
+    """
+    for _ in range(warmup):
+        fn()
+    samples = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples[i] = (time.perf_counter() - start) / number
+    p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+    return {'mean': samples.mean(), 'min': samples.min(), 'p50': p50, 'p90': p90, 'p99': p99, 'max': samples.max(),
+            'repeat': repeat, 'number': number}
+
+
+def _playing_game(frames=200, game_class=SnakeGameAI):
+    """
+    A game advanced by random moves, so hot paths are timed on a non-trivial board
+    :param frames: int
+    :param game_class: SnakeGameAI or a subclass
+    :return: SnakeGameAI()
+    """
+    game = game_class()
+    for _ in range(frames):
+        _, done, _ = game.play_step(random.choice(MOVES))
+        if done:
+            game.reset()
+    return game
+
+
+def run_benchmarks(repeat=100, warmup=10, episodes=5, seed=0):
+    """
+    Time the game, agent and trainer hot paths and a fixed-seed training run
+    :param repeat: int
+    :param warmup: int
+    :param episodes: int, games in the end-to-end training run
+    :param seed: int
+    :return: dict of benchmark name to timing statistics
+    """
+    seed_everything(seed)
+    results = {}
+    game = _playing_game()
+
+    def play_step():
+        _, done, _ = game.play_step(random.choice(MOVES))
+        if done:
+            game.reset()
+
+    results['game.play_step'] = measure(play_step, repeat, 50, warmup)
+    if HAVE_NUMBA:
+        compiled = _playing_game(game_class=CompiledSnakeGame)
+
+        def compiled_play_step():
+            _, done, _ = compiled.play_step(random.choice(MOVES))
+            if done:
+                compiled.reset()
+
+        results['game_kernel.play_step'] = measure(compiled_play_step, repeat, 50, warmup)
+    results['game.smoothness_rating'] = measure(game.smoothness_rating, repeat, 50, warmup)
+    point = Point(game.head.x + BLOCK_SIZE, game.head.y)
+    results['game.is_collision'] = measure(lambda: game.is_collision(point), repeat, 100, warmup)
+    results['game.is_blocked'] = measure(lambda: game.is_blocked(point), repeat, 100, warmup)
+
+    agent = Agent(seed=seed)
+    agent.n_games = 1000  # no random moves, so get_action always runs the model
+    state = agent.get_state(game)
+    results['agent.get_state'] = measure(lambda: agent.get_state(game), repeat, 50, warmup)
+    out = np.zeros(STATE_SIZE, dtype=np.float32)
+    results['state_encoder.encode_state'] = measure(lambda: encode_state(game, out), repeat, 50, warmup)
+    vec_game = VecSnakeGame(64, seed=seed)
+    encoder = StateEncoder(64, vec_game.rows, vec_game.cols)
+    batch_out = np.zeros((64, STATE_SIZE), dtype=np.float32)
+    results['state_encoder.encode[64]'] = measure(lambda: encoder.encode_vec(vec_game, batch_out), repeat, 10, warmup)
+    results['agent.get_action'] = measure(lambda: agent.get_action(state), repeat, 50, warmup)
+
+    rng = np.random.default_rng(seed)
+    n = 1000
+    states = rng.integers(0, 2, (n, 11))
+    next_states = rng.integers(0, 2, (n, 11))
+    actions = [MOVES[i] for i in rng.integers(0, 3, n)]
+    rewards = list(rng.choice([-10.0, 0.5, 10.0], n))
+    dones = list(rng.random(n) < 0.05)
+    trainer = agent.trainer
+    results['trainer.train_step[1]'] = measure(
+        lambda: trainer.train_step(states[0], actions[0], rewards[0], next_states[0], dones[0]), repeat, 10, warmup)
+    results['trainer.train_step[1000]'] = measure(
+        lambda: trainer.train_step(states, actions, rewards, next_states, dones), max(repeat // 10, 5), 1, 2)
+
+    results[f'train[{episodes} episodes]'] = measure(
+        lambda: train(n_games=episodes, seed=seed, save=False), 3, 1, 1)
+    return results
+
+
+def compare(results, baseline, threshold=0.1, stat='p50'):
+    """
+    Find the benchmarks that got slower than the baseline by more than threshold
+    :param results: dict
+    :param baseline: dict
+    :param threshold: float, allowed relative slowdown
+    :param stat: str, statistic to compare
+    :return: list[tuple[str, float, float]] of (name, baseline, current) for each regression
+    """
+    regressions = []
+    for name, stats in results.items():
+        if name in baseline:
+            before = baseline[name][stat]
+            after = stats[stat]
+            print(f'{name:32s} {before * 1e6:12.1f} us -> {after * 1e6:12.1f} us  ({after / before - 1:+.1%})')
+            if after > before * (1 + threshold):
+                regressions.append((name, before, after))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the game, agent and trainer hot paths')
+    parser.add_argument('--out', default='benchmark.json', help='where to write the results as JSON')
+    parser.add_argument('--baseline', help='JSON written by an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed relative slowdown of p50')
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--episodes', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.repeat, args.warmup, args.episodes, args.seed)
+    report = {
+        'meta': {'python': sys.version.split()[0], 'numpy': np.__version__, 'torch': torch.__version__,
+                 'platform': platform.platform(), 'seed': args.seed, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    for name, stats in results.items():
+        print(f"{name:32s} p50 {stats['p50'] * 1e6:12.1f} us  p99 {stats['p99'] * 1e6:12.1f} us")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}')
+            sys.exit(1)
@@ -0,0 +1,196 @@
+import copy
+import glob
+import os
+import queue
+import random
+import threading
+import numpy as np
+import torch
+from game import Point
+
+CHECKPOINT_DIR = './checkpoints'
+
+
+def snapshot(agent, game=None, stats=None, include_memory=True, episode_seeds=None):
+    """
+    Copy everything needed to resume training: model weights, Adam state, trainer hyperparameters, counters, the
+    random generators and optionally the replay memory. Take it between two games, right after game.reset(), so the
+    game itself only needs its food and frame counters.
+    The copies are taken on the calling thread and are not shared with the training objects, so they can be serialized
+    by another thread while training goes on.
+    :param agent: Agent()
+    :param game: SnakeGameAI()
+    :param stats: metrics.RunningStats()
+    :param include_memory: bool
+    :param episode_seeds: random.Random() that draws the seed of each game, or None
+    :return: dict
+    """
+    state = {
+        'model': {k: v.detach().clone() for k, v in agent.model.state_dict().items()},
+        'optimizer': copy.deepcopy(agent.trainer.optimizer.state_dict()),
+        'trainer': {'lr': agent.trainer.lr, 'gamma': agent.trainer.gamma},
+        'n_games': agent.n_games,
+        'rng': {'random': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()},
+    }
+    if game is not None:
+        state['game'] = {'food': tuple(game.food), 'max_iteration': game.max_iteration,
+                         'total_iteration': game.total_iteration}
+        if game.rng is not random:
+            state['game']['seed'] = game.seed
+            state['game']['rng'] = game.rng.getstate()
+    if episode_seeds is not None:
+        state['episode_seeds'] = episode_seeds.getstate()
+    if stats is not None:
+        state['stats'] = dict(vars(stats))
+    if include_memory:
+        state['memory'] = agent.memory.state_dict()
+    return state
+
+
+def restore(state, agent, game=None, stats=None, episode_seeds=None):
+    """
+    Load a snapshot() into a new agent, game and stats. The random generators are restored last, so anything drawn
+    while building these objects does not matter.
+    :param state: dict
+    :param agent: Agent()
+    :param game: SnakeGameAI()
+    :param stats: metrics.RunningStats()
+    :param episode_seeds: random.Random() that draws the seed of each game, or None
+    """
+    agent.model.load_state_dict(state['model'])
+    agent.trainer.optimizer.load_state_dict(state['optimizer'])
+    agent.trainer.lr = state['trainer']['lr']
+    agent.trainer.gamma = state['trainer']['gamma']
+    agent.gamma = agent.trainer.gamma
+    agent.n_games = state['n_games']
+    if 'memory' in state:
+        agent.memory.load_state_dict(state['memory'])
+    if game is not None and 'game' in state:
+        # the free cells after reset() do not depend on the food, so placing it is all that is left
+        game.food = Point(*state['game']['food'])
+        game.max_iteration = state['game']['max_iteration']
+        game.total_iteration = state['game']['total_iteration']
+        if 'rng' in state['game']:
+            # the seed of the current game, so it can still be recorded and replayed
+            game.seed = state['game'].get('seed')
+            game.rng = random.Random()
+            game.rng.setstate(state['game']['rng'])
+    if episode_seeds is not None:
+        if 'episode_seeds' not in state:
+            raise ValueError('the checkpoint was not taken while recording trajectories, so the seeds of the next '
+                             'games are unknown')
+        episode_seeds.setstate(state['episode_seeds'])
+    if stats is not None and 'stats' in state:
+        vars(stats).update(state['stats'])
+    random.setstate(state['rng']['random'])
+    np.random.set_state(state['rng']['numpy'])
+    torch.set_rng_state(state['rng']['torch'])
+
+
+class CheckpointManager:
+
+    def __init__(self, directory=CHECKPOINT_DIR, keep=3, every=25, include_memory=True, pending=2):
+        """
+        Writes checkpoints and model weights on a background thread. Each file is written under a temporary name and
+        renamed into place, so a crash never leaves a partial checkpoint, and only the last keep checkpoints are kept.
+        :param directory: str
+        :param keep: int
+        :param every: int, games between checkpoints taken by train()
+        :param include_memory: bool, also save the replay memory
+        :param pending: int, snapshots that may wait for the writer before save() blocks
+        """
+        self.directory = directory
+        self.keep = keep
+        self.every = every
+        self.include_memory = include_memory
+        os.makedirs(directory, exist_ok=True)
+        self.queue = queue.Queue(pending)
+        self.error = None
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def path(self, n_games):
+        return os.path.join(self.directory, f'checkpoint_{n_games:07d}.pt')
+
+    def save(self, agent, game=None, stats=None, episode_seeds=None):
+        """
+        Snapshot the training state and queue it for writing as checkpoint_<n_games>.pt
+        :param agent: Agent()
+        :param game: SnakeGameAI()
+        :param stats: metrics.RunningStats()
+        :param episode_seeds: random.Random() that draws the seed of each game, or None
+        """
+        self._put((snapshot(agent, game, stats, self.include_memory, episode_seeds), self.path(agent.n_games), True))
+
+    def save_model(self, model, file_name=None):
+        """
+        Queue the model's weights for writing to ./model/file_name, like Linear_QNet.save()
+        :param model: Linear_QNet() or ConvQNet()
+        :param file_name: str, the model's file_name if None
+        """
+        file_name = file_name or model.file_name
+        os.makedirs('./model', exist_ok=True)
+        weights = {k: v.detach().clone() for k, v in model.state_dict().items()}
+        self._put((weights, os.path.join('./model', file_name), False))
+
+    def _put(self, item):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(item)
+
+    def _write(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            obj, path, prune = item
+            try:
+                tmp = path + '.tmp'
+                torch.save(obj, tmp)
+                os.replace(tmp, path)
+                if prune:
+                    self._prune()
+            except Exception as e:
+                self.error = e
+
+    def _prune(self):
+        for path in self.checkpoints()[:-self.keep]:
+            os.remove(path)
+
+    def checkpoints(self):
+        """
+        :return: list[str] of the checkpoint files, oldest first
+        """
+        return list_checkpoints(self.directory)
+
+    def latest(self):
+        """
+        :return: str, the newest checkpoint, or None
+        """
+        paths = self.checkpoints()
+        return paths[-1] if paths else None
+
+    def close(self):
+        """
+        Wait for the queued writes to finish and stop the writer thread
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+def list_checkpoints(directory=CHECKPOINT_DIR):
+    """
+    :param directory: str
+    :return: list[str] of the checkpoint files written by CheckpointManager in directory, oldest first
+    """
+    return sorted(glob.glob(os.path.join(directory, 'checkpoint_*.pt')))
+
+
+def load_checkpoint(path):
+    """
+    :param path: str
+    :return: dict written by CheckpointManager.save()
+    """
+    return torch.load(path, weights_only=False)
@@ -0,0 +1,266 @@
+import json
+import os
+import queue
+import threading
+import numpy as np
+import torch
+
+# the files of a dataset directory, in the order of the arguments of QTrainer.train_batch()
+FIELDS = ['states', 'actions', 'rewards', 'next_states', 'dones']
+DTYPES = {'states': np.float32, 'actions': np.uint8, 'rewards': np.float32, 'next_states': np.float32,
+          'dones': np.bool_}
+META = 'meta.json'
+
+
+class DatasetWriter:
+
+    def __init__(self, directory, state_size=11, chunk_size=4096):
+        """
+        Appends transitions to a dataset directory: one raw array file per field and meta.json with the number of
+        transitions. Transitions are buffered and written chunk_size at a time, and meta.json is only replaced after
+        the data it counts is on disk, so readers never see a partial transition. An existing dataset is extended.
+        :param directory: str
+        :param state_size: int
+        :param chunk_size: int
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.size = 0
+        meta_path = os.path.join(directory, META)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta['state_size'] != state_size:
+                raise ValueError(f'{directory} holds states of size {meta["state_size"]}, not {state_size}')
+            self.size = meta['size']
+            # drop anything written after the last update of meta.json
+            for field in FIELDS:
+                with open(self._path(field), 'r+b') as f:
+                    f.truncate(self.size * self._row_bytes(field, state_size))
+        self.state_size = state_size
+        self.files = {field: open(self._path(field), 'ab') for field in FIELDS}
+        self.buffers = {field: np.zeros((chunk_size, state_size) if 'states' in field else chunk_size, DTYPES[field])
+                        for field in FIELDS}
+        self.filled = 0
+
+    def _path(self, field):
+        return os.path.join(self.directory, field + '.bin')
+
+    @staticmethod
+    def _row_bytes(field, state_size):
+        return np.dtype(DTYPES[field]).itemsize * (state_size if 'states' in field else 1)
+
+    def append(self, state, action, reward, next_state, done):
+        """
+        :param state: ndarray
+        :param action: list[int] one-hot move or int index
+        :param reward: float
+        :param next_state: ndarray
+        :param done: bool
+        """
+        i = self.filled
+        b = self.buffers
+        b['states'][i] = state
+        b['actions'][i] = action.index(1) if isinstance(action, list) else action
+        b['rewards'][i] = reward
+        b['next_states'][i] = next_state
+        b['dones'][i] = done
+        self.filled += 1
+        if self.filled == len(b['actions']):
+            self.flush()
+
+    def flush(self):
+        for field in FIELDS:
+            self.files[field].write(self.buffers[field][:self.filled].tobytes())
+            self.files[field].flush()
+        self.size += self.filled
+        self.filled = 0
+        tmp = os.path.join(self.directory, META + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'size': self.size, 'state_size': self.state_size}, f)
+        os.replace(tmp, os.path.join(self.directory, META))
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+
+
+def open_dataset(directory):
+    """
+    Memory-map the arrays of a dataset directory read-only
+    :param directory: str
+    :return: tuple[np.memmap, ...] of states, actions, rewards, next states and dones
+    """
+    with open(os.path.join(directory, META)) as f:
+        meta = json.load(f)
+    n, state_size = meta['size'], meta['state_size']
+    arrays = []
+    for field in FIELDS:
+        shape = (n, state_size) if 'states' in field else (n,)
+        if n == 0:
+            arrays.append(np.zeros(shape, DTYPES[field]))
+        else:
+            arrays.append(np.memmap(os.path.join(directory, field + '.bin'), DTYPES[field], 'r', shape=shape))
+    return tuple(arrays)
+
+
+class Prefetcher:
+
+    def __init__(self, arrays, batch_size, epochs=1, seed=None, depth=4):
+        """
+        Iterates over shuffled minibatches of a dataset for a number of epochs. A background thread gathers the next
+        depth batches from the memory-mapped arrays while the caller trains on the current one.
+        :param arrays: tuple returned by open_dataset()
+        :param batch_size: int
+        :param epochs: int
+        :param seed: int
+        :param depth: int, batches gathered ahead
+        """
+        self.arrays = arrays
+        self.batch_size = batch_size
+        self.epochs = epochs
+        self.rng = np.random.default_rng(seed)
+        self.queue = queue.Queue(depth)
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._fill, daemon=True)
+        self.thread.start()
+
+    def _fill(self):
+        n = len(self.arrays[1])
+        try:
+            for epoch in range(self.epochs):
+                order = self.rng.permutation(n)
+                for start in range(0, n, self.batch_size):
+                    # sorted indices read the files front to back, the order inside a batch does not matter
+                    idx = np.sort(order[start:start + self.batch_size])
+                    states, actions, rewards, next_states, dones = (a[idx] for a in self.arrays)
+                    batch = (torch.from_numpy(states), torch.from_numpy(actions.astype(np.int64)),
+                             torch.from_numpy(rewards), torch.from_numpy(next_states), torch.from_numpy(dones))
+                    if not self._put((epoch, batch)):
+                        return
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __iter__(self):
+        """
+        :return: iterator of (epoch, batch), batch being the tensors of QTrainer.train_batch()
+        """
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+
+
+def train_offline(directory, epochs=10, batch_size=1000, lr=0.001, gamma=0.5, model=None, seed=None):
+    """
+    Train a Linear_QNet with QTrainer on the transitions of a dataset directory, without playing any game
+    :param directory: str
+    :param epochs: int
+    :param batch_size: int
+    :param lr: float
+    :param gamma: float
+    :param model: Linear_QNet() to continue training, a new one if None
+    :param seed: int
+    :return: tuple[Linear_QNet, list[float]] of the model and the mean loss of each epoch
+    """
+    from model import Linear_QNet, QTrainer
+
+    if seed is not None:
+        torch.manual_seed(seed)
+    arrays = open_dataset(directory)
+    if model is None:
+        model = Linear_QNet(arrays[0].shape[1], 256, 3)
+    trainer = QTrainer(model, lr=lr, gamma=gamma)
+    losses = [0.0] * epochs
+    batches = [0] * epochs
+    prefetcher = Prefetcher(arrays, batch_size, epochs, seed)
+    try:
+        for epoch, batch in prefetcher:
+            trainer.train_batch(*batch)
+            losses[epoch] += trainer.last_loss
+            batches[epoch] += 1
+    finally:
+        prefetcher.close()
+    return model, [loss / max(n, 1) for loss, n in zip(losses, batches)]
+
+
+def from_trajectories(path, directory):
+    """
+    Write the transitions of the episodes of a trajectory file to a dataset directory, by replaying them with the
+    recorded reward settings. Raises RuntimeError if a replay differs from the recording.
+    :param path: str, file written by trajectory.TrajectoryRecorder
+    :param directory: str
+    :return: int, number of transitions written
+    """
+    from game import SnakeGameAI
+    from state_encoder import STATE_SIZE, encode_state
+    from trajectory import read_episodes
+
+    writer = DatasetWriter(directory, STATE_SIZE)
+    state = np.zeros(STATE_SIZE, dtype=np.float32)
+    next_state = np.zeros(STATE_SIZE, dtype=np.float32)
+    moves = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+    game = None
+    n = 0
+    settings = None
+    for episode in read_episodes(path):
+        if game is None or (game.w, game.h) != (episode.w, episode.h) or settings != episode.reward_settings:
+            game = SnakeGameAI(episode.w, episode.h, rewards=episode.reward_settings)
+            settings = episode.reward_settings
+        game.reset(episode.seed)
+        for i, action in enumerate(episode.actions):
+            encode_state(game, state)
+            reward, done, _ = game.play_step(moves[action])
+            # rewards are stored as float32, see trajectory.replay()
+            if np.float32(reward) != episode.rewards[i] or done != episode.dones[i]:
+                raise RuntimeError(f'replay of frame {i + 1} of the episode with seed {episode.seed} differs from the '
+                                   f'recording')
+            writer.append(state, int(action), episode.rewards[i], encode_state(game, next_state), done)
+            n += 1
+    writer.close()
+    return n
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Offline training on memory-mapped transition datasets')
+    sub = parser.add_subparsers(dest='command', required=True)
+    convert = sub.add_parser('convert', help='replay a trajectory file into a dataset')
+    convert.add_argument('trajectories')
+    convert.add_argument('dataset')
+    fit = sub.add_parser('train', help='train a model on a dataset')
+    fit.add_argument('dataset')
+    fit.add_argument('--epochs', type=int, default=10)
+    fit.add_argument('--batch-size', type=int, default=1000)
+    fit.add_argument('--lr', type=float, default=0.001)
+    fit.add_argument('--gamma', type=float, default=0.5)
+    fit.add_argument('--seed', type=int, default=None)
+    fit.add_argument('--save', default='model_offline.pth', help='file name in ./model')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        print(f'{from_trajectories(args.trajectories, args.dataset)} transitions written to {args.dataset}')
+    else:
+        model, losses = train_offline(args.dataset, args.epochs, args.batch_size, args.lr, args.gamma, seed=args.seed)
+        for epoch, loss in enumerate(losses, 1):
+            print(f'epoch {epoch:3d}  loss {loss:.4f}')
+        model.save(args.save)
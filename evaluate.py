@@ -0,0 +1,139 @@
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+import numpy as np
+import torch
+from sweep import limit_threads
+
+MODEL_DIR = './model'
+
+_models = {}  # per worker process: path to greedy policy
+
+
+def load_model(path):
+    """
+    Load a state dict written by Linear_QNet.save() or the model of a checkpoint written by CheckpointManager into a
+    Linear_QNet, with the layer sizes read from the weights
+    :param path: str
+    :return: Linear_QNet()
+    """
+    from model import Linear_QNet
+
+    state = torch.load(path, map_location='cpu', weights_only=False)
+    if 'model' in state:
+        state = state['model']
+    if 'conv1.weight' in state:
+        raise ValueError(f'{path} holds a grid observation ConvQNet, only Linear_QNet models can be evaluated')
+    hidden_size, input_size = state['linear1.weight'].shape
+    output_size = state['linear2.weight'].shape[0]
+    model = Linear_QNet(input_size, hidden_size, output_size)
+    model.load_state_dict(state)
+    model.eval()
+    return model
+
+
+def linear_models(paths):
+    """
+    Leave out the grid observation models, which load_model() cannot load, with a message
+    :param paths: list[str]
+    :return: list[str]
+    """
+    kept = []
+    for path in paths:
+        state = torch.load(path, map_location='cpu', weights_only=False)
+        if 'conv1.weight' in state.get('model', state):
+            print(f'skipping {path}: grid observation models cannot be evaluated')
+        else:
+            kept.append(path)
+    return kept
+
+
+def play_games(path, seeds, backend='numpy'):
+    """
+    Play one greedy game per seed with the model at path: no exploration and no training.
+    The seed fixes the food positions, so a seed is the same game for every model until their moves differ.
+    :param path: str
+    :param seeds: list[int]
+    :param backend: str, see model.inference_policy()
+    :return: tuple[list[int], list[int]] of the score and frames of each game
+    """
+    from agent import Agent
+    from game_kernel import make_game
+    from model import inference_policy
+
+    if path not in _models:
+        _models[path] = inference_policy(load_model(path), backend)
+    policy = _models[path]
+    game = make_game()
+    scores = []
+    frames = []
+    for seed in seeds:
+        game.reset(seed)
+        done = False
+        while not done:
+            final_move = [0, 0, 0]
+            final_move[policy(Agent.get_state(game))] = 1
+            _, done, score = game.play_step(final_move)
+        scores.append(score)
+        frames.append(game.frame_iteration)
+    return scores, frames
+
+
+def summarize(values):
+    """
+    :param values: list[int]
+    :return: dict of mean, median, p95 and max
+    """
+    values = np.asarray(values)
+    return {'mean': float(values.mean()), 'median': float(np.median(values)),
+            'p95': float(np.percentile(values, 95)), 'max': int(values.max())}
+
+
+def evaluate(paths, n_games=1000, seed=0, workers=None, chunk=50, backend='numpy'):
+    """
+    Evaluate every model on the same n_games fixed-seed games, spread over a process pool
+    :param paths: list[str]
+    :param n_games: int
+    :param seed: int, of the first game
+    :param workers: int, defaults to the number of CPUs
+    :param chunk: int, games per task
+    :param backend: str
+    :return: list[dict] with the path, score and frames statistics of each model, best mean score first
+    """
+    seeds = list(range(seed, seed + n_games))
+    chunks = [seeds[i:i + chunk] for i in range(0, n_games, chunk)]
+    with ProcessPoolExecutor(workers, mp_context=mp.get_context('spawn'), initializer=limit_threads,
+                             initargs=(1,)) as pool:
+        futures = {path: [pool.submit(play_games, path, c, backend) for c in chunks] for path in paths}
+        table = []
+        for path, parts in futures.items():
+            results = [f.result() for f in parts]
+            scores = [s for part in results for s in part[0]]
+            frames = [n for part in results for n in part[1]]
+            table.append({'path': path, 'games': n_games, 'score': summarize(scores), 'frames': summarize(frames)})
+    return sorted(table, key=lambda row: row['score']['mean'], reverse=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rank saved models by the scores of greedy fixed-seed games')
+    parser.add_argument('paths', nargs='*', help=f'.pth files or checkpoints, all of {MODEL_DIR}/*.pth by default')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--backend', choices=['torch', 'script', 'numpy'], default='numpy')
+    parser.add_argument('--out', help='write the table as JSON')
+    args = parser.parse_args()
+
+    paths = linear_models(args.paths or sorted(glob.glob(os.path.join(MODEL_DIR, '*.pth'))))
+    table = evaluate(paths, args.games, args.seed, args.workers, backend=args.backend)
+    print(f"{'rank':>4s} {'model':40s} {'mean':>7s} {'median':>7s} {'p95':>7s} {'max':>5s} {'frames':>8s}")
+    for rank, row in enumerate(table, 1):
+        s = row['score']
+        print(f"{rank:4d} {row['path']:40s} {s['mean']:7.2f} {s['median']:7.1f} {s['p95']:7.1f} {s['max']:5d} "
+              f"{row['frames']['mean']:8.1f}")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(table, f, indent=2)
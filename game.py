@@ -1,13 +1,33 @@
-import pygame
 import random
 from enum import Enum
-from collections import namedtuple
+from collections import namedtuple, deque
 import numpy as np
 import os
 import math
+import time
+from smoothness_tables import load_smoothness_tables
 
-pygame.init()
-font = pygame.font.Font('arial.ttf', 25)
+# pygame and the score font are only loaded by load_pygame(), so headless games never import SDL or need arial.ttf
+pygame = None
+font = None
+
+
+def load_pygame(module=None):
+    """
+    Import and initialise pygame and the score font on first use
+    :param module: pygame module to use instead of importing it
+    :return: module
+    """
+    global pygame, font
+    if module is None:
+        if pygame is None:
+            import pygame as pg
+            pygame = pg
+        module = pygame
+    if font is None:
+        module.init()
+        font = module.font.Font('arial.ttf', 25)
+    return module
 
 
 class Direction(Enum):
@@ -28,7 +48,21 @@ BLACK = (0, 0, 0)
 
 BLOCK_SIZE = 20
 SPEED = 1000
-
+# width of the wall border around the occupancy grid, enough for the neighbours of a head that has left the board
+GRID_PAD = 2
+# rewards of play_step, override some of them per game with SnakeGameAI(rewards={...}).
+# The smoothness/wall bonus of the original play_step compared pixels with cell offsets and was never paid, so it is
+# off by default to keep scores comparable with results/ and the saved models; {'smoothness': 10} turns it on.
+REWARDS = {'food': 10, 'death': -10, 'idle': -20, 'smoothness': 0}
+# frames without food after which a game ends with the idle reward
+IDLE_FRAMES = 1000
+
+# directions in the clockwise order of the turns of _move(), and the (row, col) cell offset of a move in each of them
+CLOCK_WISE = [Direction.RIGHT, Direction.DOWN, Direction.LEFT, Direction.UP]
+CLOCK_WISE_INDEX = {d: i for i, d in enumerate(CLOCK_WISE)}
+CLOCK_WISE_DELTAS = np.array([[0, 1], [1, 0], [0, -1], [-1, 0]], dtype=np.int64)
+# (row, col) offsets of the directions of the smoothness graphs: up, right, down, left. The graph direction of
+# clockwise index i is (i + 1) % 4
 facingDirections = [[-1, 0], [0, 1], [1, 0], [0, -1]]
 
 
@@ -50,26 +84,59 @@ def point_norm(point: Point):
     return [norm(point.x), norm(point.y)]
 
 
+def timeout_penalty(length, timeout_period):
+    """
+    Penalty of the timeout strategy: once the snake has spent more than 0.7 * length + 10 frames without food, every
+    frame costs 0.5 / length
+    :param length: int, snake length with the new head
+    :param timeout_period: int, frames since the last food, this one included
+    :return: float
+    """
+    p_steps = (0.7 * length) + 10
+    return -0.5 / length if timeout_period > p_steps else 0
+
+
+def distance_reward(length, distance_old, distance_new):
+    """
+    Distance reward function based on Wei et al. equation, positive when a move gets closer to the food
+    :param length: int, snake length with the new head
+    :param distance_old: float, distance from the old head to the food
+    :param distance_new: float, distance from the new head to the food
+    :return: float
+    """
+    return 10 * math.log((length + distance_old) / (length + distance_new), length)
+
+
 class SnakeGameAI:
 
-    def __init__(self, w=640, h=480, speed=SPEED, visual=False, left_position=False, pygame=pygame):
+    def __init__(self, w=640, h=480, speed=SPEED, visual=False, left_position=False, pygame=None, debug=False,
+                 rewards=None, seed=None):
         """
         w: width, h: height
+        Without visual the game is headless: pygame is not loaded and play_step is not throttled to speed.
         :param w: int
         :param h: int
+        :param speed: int, frames per second when visual
+        :param visual: bool
+        :param pygame: module, used for the display when visual instead of importing pygame
+        :param debug: bool, check every smoothness_rating() against the original full recomputation
+        :param rewards: dict, overrides of REWARDS
+        :param seed: int, seed of the food placement of this game, which uses the global random module if None
         """
         self.w = w
         self.h = h
         self.display = None
 
         self.pygame = pygame
+        self.clock = None
         # init display
         if visual:
+            self.pygame = load_pygame(pygame)
             os.environ["SDL_VIDEO_WINDOW_POS"] = "%i,%i" % (200, 200)
             self.display = self.pygame.display.set_mode((self.w, self.h))
             self.pygame.display.set_caption('Snake AI')
+            self.clock = self.pygame.time.Clock()
 
-        self.clock = self.pygame.time.Clock()
         self.total_iteration = 0
         self.frame_iteration = 0
         self.max_iteration = 0
@@ -78,37 +145,55 @@ class SnakeGameAI:
 
         self.speed = speed
 
-        # retrieve smoothness graphs from file
-        with open('smoothnessGraphs.txt') as file:
-            lines = file.readlines()
-
-        # save smoothness graphs using dictionaries for fast access
-        self.minDistToWall = dict()
-        self.smoothnessRatings = dict()
-
-        # iterate through smoothness graph file and save in dictionaries
-        for line in lines:
-            if len(line) > 0:
-                details = line.split("_")
-                x = int(details[0])
-                y = int(details[1])
-                direction = int(details[2])
-                min_dist_to_wall = int(details[3])
-                smoothness_rating = details[4]  # 2D array of smoothness ratings stored in string format
-                smoothness_rating = [[int(srlNum) for srlNum in srl.split(",")] for srl in smoothness_rating.split(";")]
-                self.minDistToWall[(x, y, direction)] = min_dist_to_wall
-                self.smoothnessRatings[(x, y, direction)] = smoothness_rating
-
+        # smoothness graphs indexed [row, col, direction, r, c], memory-mapped from the binary cache and shared
+        # between processes, and min distance to wall indexed [row, col, direction] (-1 if there is no graph)
+        self.smoothnessRatings, self.minDistToWall = load_smoothness_tables()
+        if self.minDistToWall.shape[0] < self.rows or self.minDistToWall.shape[1] < self.cols:
+            raise ValueError(f'smoothness graphs of size {self.minDistToWall.shape[:2]} do not cover a '
+                             f'{self.rows}x{self.cols} board, run smoothnessGenerate.py --rows {self.rows} '
+                             f'--cols {self.cols}')
+        self.debug = debug
+        rewards = dict(REWARDS, **(rewards or {}))
+        self.food_reward = rewards['food']
+        self.death_reward = rewards['death']
+        self.idle_reward = rewards['idle']
+        self.smoothness_reward = rewards['smoothness']
+
+        # occupancy grid of the board surrounded by GRID_PAD cells of wall, so one lookup detects both collisions.
+        # body_grid is the board part of it, and marks the cells occupied by the snake
+        self.grid = np.ones((self.rows + 2 * GRID_PAD, self.cols + 2 * GRID_PAD), dtype=np.uint8)
+        self.body_grid = self.grid[GRID_PAD:-GRID_PAD, GRID_PAD:-GRID_PAD]
+
+        self.seed = seed
+        self.rng = random if seed is None else random.Random(seed)
         self.reset()
 
-    def reset(self):
+    def reset(self, seed=None):
+        """
+        Start a new episode
+        :param seed: int, reseed the food placement, so the episode can be replayed from its seed and actions
+        """
+        if seed is not None:
+            self.seed = seed
+            self.rng = random.Random(seed)
+
         # initial game state
         self.direction = Direction.RIGHT
 
         self.head = Point(self.w / 2, self.h / 2)
-        self.snake = [self.head,
-                      Point(self.head.x - BLOCK_SIZE, self.head.y),
-                      Point(self.head.x - (2 * BLOCK_SIZE), self.head.y)]
+        self.snake = deque([self.head,
+                            Point(self.head.x - BLOCK_SIZE, self.head.y),
+                            Point(self.head.x - (2 * BLOCK_SIZE), self.head.y)])
+        # cells occupied by the snake, updated with each head added and tail removed
+        self.body_grid[:] = 0
+        for pt in self.snake:
+            self.body_grid[norm(pt.y), norm(pt.x)] = 1
+        # free cells (row * cols + col) in no particular order, and the position of each cell in that list (-1 if
+        # occupied), so cells are added and removed by swapping with the last entry
+        self.free_cells = np.flatnonzero(self.body_grid.ravel() == 0).tolist()
+        self.free_position = [-1] * (self.rows * self.cols)
+        for i, cell in enumerate(self.free_cells):
+            self.free_position[cell] = i
 
         self.score = 0
         self.food = None
@@ -123,13 +208,42 @@ class SnakeGameAI:
         self.M = 0
         self.frame_timeout_period = 0  # Restart frame_timeout_period
 
+    def _occupy(self, pt):
+        """
+        Mark the cell of pt as part of the snake
+        :param pt: Point()
+        """
+        row, col = norm(pt.y), norm(pt.x)
+        self.body_grid[row, col] = 1
+        cell = row * self.cols + col
+        i = self.free_position[cell]
+        last = self.free_cells.pop()
+        if last != cell:
+            self.free_cells[i] = last
+            self.free_position[last] = i
+        self.free_position[cell] = -1
+
+    def _release(self, pt):
+        """
+        Mark the cell of pt as free
+        :param pt: Point()
+        """
+        row, col = norm(pt.y), norm(pt.x)
+        self.body_grid[row, col] = 0
+        cell = row * self.cols + col
+        self.free_position[cell] = len(self.free_cells)
+        self.free_cells.append(cell)
+
     def _place_food(self):
-        # place food randomly
-        x = random.randint(0, (self.w - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        y = random.randint(0, (self.h - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        self.food = Point(x, y)
-        if self.food in self.snake:
-            self._place_food()
+        """
+        Place food on a cell drawn uniformly from the free cells
+        :return: bool, False if the snake fills the board and the food was not moved
+        """
+        if len(self.free_cells) == 0:
+            return False
+        cell = self.free_cells[self.rng.randrange(len(self.free_cells))]
+        self.food = Point((cell % self.cols) * BLOCK_SIZE, (cell // self.cols) * BLOCK_SIZE)
+        return True
 
     @staticmethod
     def distance(point1, point2):
@@ -158,77 +272,121 @@ class SnakeGameAI:
         #         self.pygame.quit()
         #         quit()
 
-        possDirs, minTail, maxTail, minWall, maxWall = self.smoothness_rating()
+        possDirs = []
+        if self.smoothness_reward:
+            possDirs, minTail, maxTail, minWall, maxWall = self.smoothness_rating()
 
         oldHead = self.head
 
         # 2. move
         old_head = self.head
         self._move(action)  # update the head
-        self.snake.insert(0, self.head)
+        self.snake.appendleft(self.head)
 
         # 3. check if game over
         game_over = False
         if self.is_collision():  # or self.frame_iteration > 100*len(self.snake):
             game_over = True
-            reward = -10
+            reward = self.death_reward
             return reward, game_over, self.score
+        self._occupy(self.head)
 
         reward = 0
 
         # 3.2 timeout strategy
-        p_steps = (0.7 * len(self.snake)) + 10
-        if self.frame_timeout_period > p_steps:
-            reward += -0.5 / len(self.snake)
+        reward += timeout_penalty(len(self.snake), self.frame_timeout_period)
 
         # 3.3 idle too long
-        if self.frame_timeout_period == 1000:
+        if self.frame_timeout_period == IDLE_FRAMES:
             game_over = True
-            reward += -20
+            reward += self.idle_reward
             return reward, game_over, self.score
 
         # 4. place new food or just move
         elif self.head == self.food:
             self.score += 1
             self.frame_timeout_period = 0  # Reset frame_timeout_period
-            reward += 10
-            self._place_food()
+            reward += self.food_reward
+            if not self._place_food():
+                # the snake fills the board: the game is won
+                game_over = True
         else:
             # Distance reward function based on Wei et al. equation
-            length = len(self.snake)
-            distance_old = self.distance(old_head, self.food)
-            distance_new = self.distance(self.head, self.food)
-            reward += 10 * math.log((length + distance_old) / (length + distance_new), length)
-            self.snake.pop()
+            reward += distance_reward(len(self.snake), self.distance(old_head, self.food),
+                                      self.distance(self.head, self.food))
+            tail = self.snake.pop()
+            self._release(tail)
 
         # smoothness/space rating rewards
         if len(possDirs) != 0:
             for poss in possDirs:
                 p = poss[0]
-                possHead = [oldHead.x + facingDirections[p][0], oldHead.y + facingDirections[p][1]]
-                if possHead[0] == self.head.x and possHead[1] == self.head.y:
+                # facingDirections are (row, col) cell offsets, so compare in cell units
+                possHead = [norm(oldHead.y) + facingDirections[p][0], norm(oldHead.x) + facingDirections[p][1]]
+                if possHead == [norm(self.head.y), norm(self.head.x)]:
                     # negative reward (penalty) if tail rating or distance to wall are minimum
                     # positive reward if tail rating or distance to wall are maximum
                     # no reward if either are intermediate
                     tailRating = poss[1]
                     if tailRating == minTail:
-                        reward -= 10
+                        reward -= self.smoothness_reward
                     elif tailRating == maxTail:
-                        reward += 10
+                        reward += self.smoothness_reward
                     distWall = poss[2]
                     if distWall == minWall:
-                        reward -= 10
+                        reward -= self.smoothness_reward
                     elif distWall == maxWall:
-                        reward += 10
+                        reward += self.smoothness_reward
 
-        self._update_ui()
-        self.clock.tick(self.speed)
+        if self.display:
+            self._update_ui()
+            self.clock.tick(self.speed)
         # 6. return reward, game over and score
         return reward, game_over, self.score
 
     def smoothness_rating(self):
         """
         Retrieve stored smoothness rating graph that applies to current location and direction
+        For each direction, calculate tail rating by adding smoothness ratings of each point in the tail. This is done
+        for all directions at once as a dot product of the graphs with the body occupancy grid, so the cost does not
+        depend on the length of the snake.
+        For each direction, retrieve wall rating
+        Return maximum and minimum wall ratings and tail ratings, and return all wall ratings
+        :return: tuple[list[list[int]], float | int | int | int | int]
+        """
+        ignore = [None, None]
+        if len(self.snake) > 0:
+            ignore = [norm(self.snake[1][1]) - norm(self.head[1]), norm(self.snake[1][0]) - norm(self.head[0])]
+        possDirs = []
+        minTail = float('inf')
+        minWall = float('inf')
+        maxTail = float('-inf')
+        maxWall = float('-inf')
+
+        row, col = norm(self.head.y), norm(self.head.x)
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            tailRatings = np.einsum('drc,rc->d', self.smoothnessRatings[row, col, :, :self.rows, :self.cols],
+                                    self.body_grid, dtype=np.int64)
+            distWalls = self.minDistToWall[row, col]
+            for d in range(4):
+                if facingDirections[d] != ignore and distWalls[d] >= 0:
+                    tailRating = int(tailRatings[d])
+                    distWall = int(distWalls[d])
+                    minTail = min(tailRating, minTail)
+                    maxTail = max(tailRating, maxTail)
+                    minWall = min(distWall, minWall)
+                    maxWall = max(distWall, maxWall)
+                    possDirs.append([d, tailRating, distWall])
+
+        if self.debug:
+            reference = self._smoothness_rating_reference()
+            assert (possDirs, minTail, maxTail, minWall, maxWall) == reference, reference
+        return possDirs, minTail, maxTail, minWall, maxWall
+
+    def _smoothness_rating_reference(self):
+        """
+        Original implementation of smoothness_rating(), O(len(snake)) per direction. Used to check it in debug mode.
+        Retrieve stored smoothness rating graph that applies to current location and direction
         Fetch smoothness ratings from graph for the current snake
         For each direction, calculate tail rating by adding smoothness ratings of each point in the tail
         For each direction, retrieve wall rating
@@ -245,14 +403,15 @@ class SnakeGameAI:
         maxWall = float('-inf')
 
         normHead = [norm(self.head.y), norm(self.head.x)]
+        in_table = normHead[0] < self.minDistToWall.shape[0] and normHead[1] < self.minDistToWall.shape[1]
         for d in range(4):
             triple = (normHead[0], normHead[1], d)
-            if facingDirections[d] != ignore and triple in self.smoothnessRatings and triple in self.minDistToWall:
+            if facingDirections[d] != ignore and in_table and self.minDistToWall[triple] >= 0:
                 tailRating = 0
                 smoothnessRatings = self.smoothnessRatings[triple]
                 for t in self.snake:
-                    tailRating += smoothnessRatings[norm(t.y)][norm(t.x)]
-                distWall = self.minDistToWall[triple]
+                    tailRating += int(smoothnessRatings[norm(t.y), norm(t.x)])
+                distWall = int(self.minDistToWall[triple])
                 minTail = min(tailRating, minTail)
                 maxTail = max(tailRating, maxTail)
                 minWall = min(distWall, minWall)
@@ -260,9 +419,19 @@ class SnakeGameAI:
                 possDirs.append([d, tailRating, distWall])
         return possDirs, minTail, maxTail, minWall, maxWall
 
+    def is_blocked(self, pt):
+        """
+        Read-only check of whether pt is a wall or a cell occupied by the snake, used for the danger bits of the state.
+        The new head is only added to the grid once play_step has checked it, so after a fatal move the grid still
+        holds the body that was hit.
+        :param pt: Point()
+        :return: bool
+        """
+        return self.grid[norm(pt.y) + GRID_PAD, norm(pt.x) + GRID_PAD] != 0
+
     def is_collision(self, pt=None):
         """
-        Detects if snake's head has collided with wall or with its tail
+        Detects if snake's head has collided with wall or with its tail, and updates the Frame1/Frame2/M/DPA counters
         :param pt: Point()
         :return: bool
         """
@@ -273,21 +442,13 @@ class SnakeGameAI:
 
         if pt is None:
             pt = self.head
-        # hits boundary
-        if pt.x > self.w - BLOCK_SIZE or pt.x < 0 or pt.y > self.h - BLOCK_SIZE or pt.y < 0:
+        # hits boundary or itself
+        if self.is_blocked(pt):
             # self.updateM()
-            self.Frame1 = int(self.Frame2)
-            self.Frame2 = int(self.frame_iteration)
-            if self.Frame1 != 0 and self.Frame2 != 0:
-                self.M = self.length - (self.Frame2 - self.Frame1) + 1
-            return True
-        # hits itself
-        if pt in self.snake[1:]:
             self.Frame1 = int(self.Frame2)
             self.Frame2 = int(self.frame_iteration)
             if self.Frame1 != 0 and self.Frame2 != 0:
                 self.M = int(self.length - (self.Frame2 - self.Frame1) + 1)
-
             return True
 
         return False
@@ -314,17 +475,16 @@ class SnakeGameAI:
         """
         # [straight, right, left]
 
-        clock_wise = [Direction.RIGHT, Direction.DOWN, Direction.LEFT, Direction.UP]
-        idx = clock_wise.index(self.direction)
+        idx = CLOCK_WISE.index(self.direction)
 
         if np.array_equal(action, [1, 0, 0]):
-            new_dir = clock_wise[idx]  # no change
+            new_dir = CLOCK_WISE[idx]  # no change
         elif np.array_equal(action, [0, 1, 0]):
             next_idx = (idx + 1) % 4
-            new_dir = clock_wise[next_idx]  # right turn r -> d -> l -> u
+            new_dir = CLOCK_WISE[next_idx]  # right turn r -> d -> l -> u
         else:  # [0, 0, 1]
             next_idx = (idx - 1) % 4
-            new_dir = clock_wise[next_idx]  # left turn r -> u -> l -> d
+            new_dir = CLOCK_WISE[next_idx]  # left turn r -> u -> l -> d
 
         self.direction = new_dir
 
@@ -340,3 +500,39 @@ class SnakeGameAI:
             y -= BLOCK_SIZE
 
         self.head = Point(x, y)
+
+
+def measure_fps(visual=False, frames=5000, speed=SPEED):
+    """
+    Time the construction of a game and frames per second of play_step with random moves
+    :param visual: bool
+    :param frames: int
+    :param speed: int
+    :return: dict
+    """
+    start = time.perf_counter()
+    game = SnakeGameAI(visual=visual, speed=speed)
+    startup = time.perf_counter() - start
+
+    moves = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+    start = time.perf_counter()
+    for _ in range(frames):
+        _, done, _ = game.play_step(random.choice(moves))
+        if done:
+            game.reset()
+    elapsed = time.perf_counter() - start
+    return {'visual': visual, 'startup_s': startup, 'fps': frames / elapsed, 'pygame_loaded': pygame is not None}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Report startup time and frames per second of SnakeGameAI')
+    parser.add_argument('--frames', type=int, default=5000)
+    parser.add_argument('--visual', action='store_true', help='also measure with a display')
+    args = parser.parse_args()
+
+    for visual in ([False, True] if args.visual else [False]):
+        result = measure_fps(visual, args.frames)
+        print(f"{'visual' if visual else 'headless'}: startup {result['startup_s'] * 1000:.1f} ms, "
+              f"{result['fps']:.0f} frames/s, pygame loaded: {result['pygame_loaded']}")
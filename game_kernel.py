@@ -0,0 +1,413 @@
+import math
+import random
+import numpy as np
+from game import (SnakeGameAI, Direction, Point, BLOCK_SIZE, GRID_PAD, CLOCK_WISE, CLOCK_WISE_DELTAS,
+                  facingDirections, norm)
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# the kernel is compiled when numba is installed, otherwise CompiledSnakeGame runs it as plain (slow) Python, which is
+# only useful to check it, and make_game() falls back to SnakeGameAI
+HAVE_NUMBA = njit is not None
+ENGINES = ['auto', 'python', 'numba']
+jit = njit(cache=True) if HAVE_NUMBA else (lambda f: f)
+
+# slots of CompiledSnakeGame.counters
+HEAD = 0  # index of the head in the body ring buffer
+SIZE = 1  # number of segments in the body ring buffer, len(game.snake)
+DIRECTION = 2  # clockwise index, see game.CLOCK_WISE
+FOOD_ROW = 3
+FOOD_COL = 4
+FRAME_ITERATION = 5
+FRAME_TIMEOUT_PERIOD = 6
+SCORE = 7
+FREE = 8  # number of free cells at the front of the free cell list
+FRAME1 = 9
+FRAME2 = 10
+M = 11
+DPA = 12
+LENGTH = 13
+N_COUNTERS = 14
+
+# slots of CompiledSnakeGame.params
+FOOD_REWARD = 0
+DEATH_REWARD = 1
+IDLE_REWARD = 2
+SMOOTHNESS_REWARD = 3
+X_OFFSET = 4  # pixel position of the head inside its cell, 0 unless w / 2 or h / 2 is not a multiple of BLOCK_SIZE
+Y_OFFSET = 5
+
+# outcomes of step()
+MOVED = 0
+COLLIDED = 1
+IDLE = 2
+ATE = 3
+
+# numba reads global arrays, not lists
+FACING = np.array(facingDirections, dtype=np.int64)
+# [straight, right, left] moves to their index, anything else turns left like SnakeGameAI._move()
+MOVE_INDEX = {(1, 0, 0): 0, (0, 1, 0): 1}
+
+
+@jit
+def _occupy(row, col, cols, counters, grid, free_cells, free_position):
+    """
+    Mark a cell as part of the snake, see SnakeGameAI._occupy()
+    """
+    grid[row + GRID_PAD, col + GRID_PAD] = 1
+    cell = row * cols + col
+    i = free_position[cell]
+    counters[FREE] -= 1
+    last = free_cells[counters[FREE]]
+    if last != cell:
+        free_cells[i] = last
+        free_position[last] = i
+    free_position[cell] = -1
+
+
+@jit
+def _release(row, col, cols, counters, grid, free_cells, free_position):
+    """
+    Mark a cell as free, see SnakeGameAI._release()
+    """
+    grid[row + GRID_PAD, col + GRID_PAD] = 0
+    cell = row * cols + col
+    free_position[cell] = counters[FREE]
+    free_cells[counters[FREE]] = cell
+    counters[FREE] += 1
+
+
+@jit
+def start(row, col, counters, body, grid, free_cells, free_position):
+    """
+    Set up the board of a new game, see SnakeGameAI.reset(): the snake on row, its head on col facing right, and the
+    free cells in increasing order
+    :param row: int
+    :param col: int
+    :param counters: ndarray[int64] of N_COUNTERS
+    :param body: ndarray[int64] (capacity, 2)
+    :param grid: ndarray[uint8]
+    :param free_cells: ndarray[int64]
+    :param free_position: ndarray[int64]
+    """
+    rows = grid.shape[0] - 2 * GRID_PAD
+    cols = grid.shape[1] - 2 * GRID_PAD
+    # direction 0 is right
+    counters[:] = 0
+    grid[GRID_PAD:GRID_PAD + rows, GRID_PAD:GRID_PAD + cols] = 0
+    # the tail first, so the head is at index 2
+    for i in range(3):
+        body[i, 0] = row
+        body[i, 1] = col - 2 + i
+        grid[row + GRID_PAD, col - 2 + i + GRID_PAD] = 1
+    counters[HEAD] = 2
+    counters[SIZE] = 3
+    n = 0
+    for cell in range(rows * cols):
+        if grid[cell // cols + GRID_PAD, cell % cols + GRID_PAD] == 0:
+            free_cells[n] = cell
+            free_position[cell] = n
+            n += 1
+        else:
+            free_position[cell] = -1
+    counters[FREE] = n
+
+
+@jit
+def step(move, counters, params, body, grid, free_cells, free_position, ratings, walls):
+    """
+    One play_step() of a game held in integer arrays: smoothness rating, move, collision, timeout, food and rewards.
+    Food is not placed here, the caller draws it from free_cells with the game's rng when the outcome is ATE, so
+    the sequence of random numbers is the one of SnakeGameAI.
+    :param move: int, 0 straight, 1 right, 2 left
+    :param counters: ndarray[int64] of N_COUNTERS
+    :param params: ndarray[float64] of rewards and offsets
+    :param body: ndarray[int64] (capacity, 2), ring buffer of the (row, col) of the segments
+    :param grid: ndarray[uint8], the padded occupancy grid of the game
+    :param free_cells: ndarray[int64]
+    :param free_position: ndarray[int64]
+    :param ratings: ndarray[int16] smoothness graphs [row, col, dir, r, c]
+    :param walls: ndarray[int16] min distance to wall [row, col, dir]
+    :return: tuple[float, int, int, int] of reward, outcome, row and col of the head
+    """
+    rows = grid.shape[0] - 2 * GRID_PAD
+    cols = grid.shape[1] - 2 * GRID_PAD
+    capacity = body.shape[0]
+    counters[FRAME_ITERATION] += 1
+    counters[FRAME_TIMEOUT_PERIOD] += 1
+
+    # smoothness rating of the directions other than back into the neck, only needed when the bonus is paid
+    head = counters[HEAD]
+    size = counters[SIZE]
+    row = body[head, 0]
+    col = body[head, 1]
+    neck = (head - 1) % capacity
+    ignore_row = body[neck, 0] - row
+    ignore_col = body[neck, 1] - col
+    n_poss = 0
+    min_tail = 0
+    max_tail = 0
+    min_wall = 0
+    max_wall = 0
+    tail_ratings = np.zeros(4, dtype=np.int64)
+    valid = np.zeros(4, dtype=np.bool_)
+    if params[SMOOTHNESS_REWARD] != 0 and 0 <= row < rows and 0 <= col < cols:
+        for d in range(4):
+            if (FACING[d, 0] == ignore_row and FACING[d, 1] == ignore_col) or walls[row, col, d] < 0:
+                continue
+            tail = np.int64(0)
+            for k in range(size):
+                i = (head - k) % capacity
+                tail += ratings[row, col, d, body[i, 0], body[i, 1]]
+            wall = walls[row, col, d]
+            if n_poss == 0 or tail < min_tail:
+                min_tail = tail
+            if n_poss == 0 or tail > max_tail:
+                max_tail = tail
+            if n_poss == 0 or wall < min_wall:
+                min_wall = wall
+            if n_poss == 0 or wall > max_wall:
+                max_wall = wall
+            tail_ratings[d] = tail
+            valid[d] = True
+            n_poss += 1
+
+    # move
+    if move == 1:
+        counters[DIRECTION] = (counters[DIRECTION] + 1) % 4
+    elif move == 2:
+        counters[DIRECTION] = (counters[DIRECTION] - 1) % 4
+    direction = counters[DIRECTION]
+    new_row = row + CLOCK_WISE_DELTAS[direction, 0]
+    new_col = col + CLOCK_WISE_DELTAS[direction, 1]
+    head = (head + 1) % capacity
+    body[head, 0] = new_row
+    body[head, 1] = new_col
+    counters[HEAD] = head
+    counters[SIZE] = size + 1
+
+    # collision, with the Frame1/Frame2/M/DPA counters of SnakeGameAI.is_collision()
+    if (counters[FRAME2] <= counters[FRAME_ITERATION] + counters[M] and counters[M] > 0
+            and counters[DPA] == 0):
+        counters[DPA] = 1
+    else:
+        counters[DPA] = 0
+    if grid[new_row + GRID_PAD, new_col + GRID_PAD] != 0:
+        counters[FRAME1] = counters[FRAME2]
+        counters[FRAME2] = counters[FRAME_ITERATION]
+        if counters[FRAME1] != 0 and counters[FRAME2] != 0:
+            counters[M] = counters[LENGTH] - (counters[FRAME2] - counters[FRAME1]) + 1
+        return params[DEATH_REWARD], COLLIDED, new_row, new_col
+    _occupy(new_row, new_col, cols, counters, grid, free_cells, free_position)
+
+    # the same sums in the same order as play_step(), so the rewards are equal to the last bit
+    reward = 0.0
+    length = size + 1
+    if counters[FRAME_TIMEOUT_PERIOD] > 0.7 * length + 10:
+        reward += -0.5 / length
+
+    if counters[FRAME_TIMEOUT_PERIOD] == 1000:
+        return reward + params[IDLE_REWARD], IDLE, new_row, new_col
+
+    outcome = MOVED
+    x_offset = params[X_OFFSET]
+    y_offset = params[Y_OFFSET]
+    food_row = counters[FOOD_ROW]
+    food_col = counters[FOOD_COL]
+    # the head is only ever on the food if it is aligned with the cells, like the Points compared by play_step()
+    if new_row == food_row and new_col == food_col and x_offset == 0 and y_offset == 0:
+        counters[SCORE] += 1
+        counters[FRAME_TIMEOUT_PERIOD] = 0
+        reward += params[FOOD_REWARD]
+        outcome = ATE
+    else:
+        # distance reward function based on Wei et al. equation, in pixels
+        food_x = food_col * BLOCK_SIZE
+        food_y = food_row * BLOCK_SIZE
+        distance_old = math.sqrt((col * BLOCK_SIZE + x_offset - food_x) ** 2 +
+                                 (row * BLOCK_SIZE + y_offset - food_y) ** 2)
+        distance_new = math.sqrt((new_col * BLOCK_SIZE + x_offset - food_x) ** 2 +
+                                 (new_row * BLOCK_SIZE + y_offset - food_y) ** 2)
+        # math.log(x, base) is log(x) / log(base)
+        reward += 10 * (math.log((length + distance_old) / (length + distance_new)) / math.log(length))
+        tail = (head - size) % capacity
+        _release(body[tail, 0], body[tail, 1], cols, counters, grid, free_cells, free_position)
+        counters[SIZE] = size
+
+    # smoothness/space rating rewards of the direction taken
+    taken = (direction + 1) % 4
+    if valid[taken]:
+        smoothness = params[SMOOTHNESS_REWARD]
+        tail = tail_ratings[taken]
+        if tail == min_tail:
+            reward -= smoothness
+        elif tail == max_tail:
+            reward += smoothness
+        wall = walls[row, col, taken]
+        if wall == min_wall:
+            reward -= smoothness
+        elif wall == max_wall:
+            reward += smoothness
+    return reward, outcome, new_row, new_col
+
+
+class SnakeBody:
+
+    def __init__(self, game):
+        """
+        Read-only view of the body ring buffer of a CompiledSnakeGame as the Points of SnakeGameAI.snake, head first
+        :param game: CompiledSnakeGame()
+        """
+        self.game = game
+
+    def __len__(self):
+        return int(self.game.counters[SIZE])
+
+    def __getitem__(self, i):
+        game = self.game
+        size = len(self)
+        if i < 0:
+            i += size
+        if not 0 <= i < size:
+            raise IndexError('snake index out of range')
+        row, col = game.body[(game.counters[HEAD] - i) % len(game.body)].tolist()
+        return Point(col * BLOCK_SIZE + game.params[X_OFFSET], row * BLOCK_SIZE + game.params[Y_OFFSET])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+def _counter(slot):
+    """
+    Attribute of SnakeGameAI that CompiledSnakeGame keeps in its counters array
+    :param slot: int
+    :return: property
+    """
+    def get(self):
+        return int(self.counters[slot])
+
+    def set(self, value):
+        self.counters[slot] = value
+
+    return property(get, set)
+
+
+class CompiledSnakeGame(SnakeGameAI):
+
+    frame_iteration = _counter(FRAME_ITERATION)
+    frame_timeout_period = _counter(FRAME_TIMEOUT_PERIOD)
+    score = _counter(SCORE)
+    Frame1 = _counter(FRAME1)
+    Frame2 = _counter(FRAME2)
+    M = _counter(M)
+    DPA = _counter(DPA)
+    length = _counter(LENGTH)
+
+    def __init__(self, *args, **kwargs):
+        """
+        SnakeGameAI whose play_step() runs the step() kernel over plain integer arrays, compiled with numba when it is
+        installed. Games with the same seed and actions give the same rewards, dones and scores as SnakeGameAI.
+        head, direction, food, snake, grid and body_grid are kept up to date, so the state encoders, checkpoints
+        and the display work as with SnakeGameAI. Takes the arguments of SnakeGameAI.
+        """
+        self.counters = np.zeros(N_COUNTERS, dtype=np.int64)
+        self.params = np.zeros(6, dtype=np.float64)
+        self._food = None
+        self.body = None
+        super().__init__(*args, **kwargs)
+        self.params[:] = (self.food_reward, self.death_reward, self.idle_reward, self.smoothness_reward,
+                          self.params[X_OFFSET], self.params[Y_OFFSET])
+        # plain ndarrays over the memory maps
+        self.ratings = np.asarray(self.smoothnessRatings)
+        self.walls = np.asarray(self.minDistToWall)
+
+    @property
+    def snake(self):
+        return SnakeBody(self)
+
+    @property
+    def food(self):
+        return self._food
+
+    @food.setter
+    def food(self, point):
+        self._food = point
+        if point is not None:
+            self.counters[FOOD_ROW] = norm(point.y)
+            self.counters[FOOD_COL] = norm(point.x)
+
+    def reset(self, seed=None):
+        """
+        Start a new episode, see SnakeGameAI.reset()
+        :param seed: int
+        """
+        if seed is not None:
+            self.seed = seed
+            self.rng = random.Random(seed)
+
+        self.direction = Direction.RIGHT
+        self.head = Point(self.w / 2, self.h / 2)
+        row, col = norm(self.head.y), norm(self.head.x)
+        self.params[X_OFFSET] = self.head.x - col * BLOCK_SIZE
+        self.params[Y_OFFSET] = self.head.y - row * BLOCK_SIZE
+        if self.body is None:
+            # ring buffer large enough for a full board and the head of a last collision
+            self.body = np.zeros((self.rows * self.cols + 1, 2), dtype=np.int64)
+            self.free_cells = np.zeros(self.rows * self.cols, dtype=np.int64)
+            self.free_position = np.zeros(self.rows * self.cols, dtype=np.int64)
+        self.max_iteration = max(self.frame_iteration, self.max_iteration)
+        self.total_iteration += self.frame_iteration
+        # clears the score and frame counters too
+        start(row, col, self.counters, self.body, self.grid, self.free_cells, self.free_position)
+        self.food = None
+        self._place_food()
+
+    def _place_food(self):
+        """
+        Place food on a cell drawn uniformly from the free cells
+        :return: bool, False if the snake fills the board and the food was not moved
+        """
+        n = int(self.counters[FREE])
+        if n == 0:
+            return False
+        cell = int(self.free_cells[self.rng.randrange(n)])
+        self.food = Point((cell % self.cols) * BLOCK_SIZE, (cell // self.cols) * BLOCK_SIZE)
+        return True
+
+    def play_step(self, action):
+        """
+        :param action: list[int] one-hot [straight, right, left], or its index
+        :return: tuple[float, bool, int] of reward, game over and score
+        """
+        move = action if isinstance(action, int) else MOVE_INDEX.get(tuple(action), 2)
+        reward, outcome, row, col = step(move, self.counters, self.params, self.body, self.grid, self.free_cells,
+                                         self.free_position, self.ratings, self.walls)
+        params = self.params
+        self.head = Point(col * BLOCK_SIZE + params[X_OFFSET], row * BLOCK_SIZE + params[Y_OFFSET])
+        self.direction = CLOCK_WISE[self.counters[DIRECTION]]
+        if outcome == COLLIDED or outcome == IDLE:
+            return reward, True, self.score
+        # a full board is a win
+        game_over = outcome == ATE and not self._place_food()
+        if self.display:
+            self._update_ui()
+            self.clock.tick(self.speed)
+        return reward, game_over, self.score
+
+
+def make_game(*args, engine='auto', **kwargs):
+    """
+    :param engine: str, 'numba' for CompiledSnakeGame, 'python' for SnakeGameAI, 'auto' for CompiledSnakeGame if numba
+    is installed and SnakeGameAI otherwise
+    :return: SnakeGameAI() or CompiledSnakeGame() with the other arguments of SnakeGameAI
+    """
+    if engine not in ENGINES:
+        raise ValueError(f'unknown game engine {engine!r}')
+    if engine == 'numba' and not HAVE_NUMBA:
+        raise ImportError('the numba game engine needs numba, pip install numba')
+    if engine == 'python' or not HAVE_NUMBA:
+        return SnakeGameAI(*args, **kwargs)
+    return CompiledSnakeGame(*args, **kwargs)
@@ -0,0 +1,164 @@
+import csv
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+FIELDS = ['game', 'score', 'mean_score', 'record', 'frames', 'elapsed_s']
+
+
+class RunningStats:
+    """
+    Constant-memory aggregates of the finished games of a training run
+    """
+
+    def __init__(self):
+        self.n_games = 0
+        self.total_score = 0
+        self.record = 0
+        self.max_iteration = 0
+        self.total_iteration = 0
+
+    def add(self, score, frames):
+        """
+        :param score: int
+        :param frames: int, frames the game lasted
+        :return: bool, whether score is a new record
+        """
+        self.n_games += 1
+        self.total_score += score
+        self.max_iteration = max(self.max_iteration, frames)
+        self.total_iteration += frames
+        if score > self.record:
+            self.record = score
+            return True
+        return False
+
+    @property
+    def mean_score(self):
+        return self.total_score / self.n_games if self.n_games else 0
+
+    @property
+    def avg_iteration(self):
+        return self.total_iteration / self.n_games if self.n_games else 0
+
+
+class MetricsLog:
+
+    def __init__(self, path, maxsize=1024, resume_from=0):
+        """
+        Append-only CSV of episode stats, one row per game, written by a background thread so the training loop only
+        pays for a queue put. Rows are flushed as they are written, so the file can be plotted while training runs.
+        :param path: str, e.g. results/<title>.csv, truncated if it exists
+        :param maxsize: int, rows that may wait for the writer before log() blocks
+        :param resume_from: int, keep the rows of the first resume_from games of an existing log and append after them
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.kept = []
+        if resume_from > 0 and os.path.exists(path):
+            with open(path, newline='') as f:
+                self.kept = [row for row in csv.reader(f) if row[0].isdigit() and int(row[0]) <= resume_from]
+        self.queue = queue.Queue(maxsize)
+        self.start = time.perf_counter()
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def log(self, game, score, mean_score, record, frames):
+        """
+        :param game: int, number of the game, from 1
+        :param score: int
+        :param mean_score: float
+        :param record: int
+        :param frames: int
+        """
+        self.queue.put((game, score, mean_score, record, frames, round(time.perf_counter() - self.start, 3)))
+
+    def _write(self):
+        with open(self.path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            writer.writerows(self.kept)
+            while True:
+                row = self.queue.get()
+                if row is None:
+                    break
+                writer.writerow(row)
+                # only flush once the writer has caught up, a backlog is written in one go
+                if self.queue.empty():
+                    f.flush()
+
+    def close(self):
+        """
+        Write the rows still queued and stop the writer thread
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+
+def read_log(path):
+    """
+    :param path: str, CSV written by MetricsLog
+    :return: tuple[list[int], list[float]] of scores and mean scores
+    """
+    scores = []
+    mean_scores = []
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            scores.append(int(row['score']))
+            mean_scores.append(float(row['mean_score']))
+    return scores, mean_scores
+
+
+def plot_log(path, title=None, out=None):
+    """
+    Save the plot of scores (blue line) and mean scores (orange line) of a metrics log, without a display
+    :param path: str, CSV written by MetricsLog
+    :param title: str
+    :param out: str, image file, defaults to path with a .png extension
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    scores, mean_scores = read_log(path)
+    plt.title(title if title else 'Training...')
+    plt.xlabel('Number of Games')
+    plt.ylabel('Score')
+    plt.plot(scores)
+    plt.plot(mean_scores)
+    plt.ylim(ymin=0)
+    if scores:
+        plt.text(len(scores) - 1, scores[-1], str(scores[-1]))
+        plt.text(len(mean_scores) - 1, mean_scores[-1], str(mean_scores[-1]))
+    plt.savefig(out if out else os.path.splitext(path)[0] + '.png')
+    plt.close()
+
+
+def plot_in_background(path, title=None, out=None):
+    """
+    Run plot_log in a separate Python process, which finishes even if the caller exits first.
+    A subprocess rather than multiprocessing, so callers need no __main__ guard.
+    :return: subprocess.Popen
+    """
+    command = [sys.executable, os.path.abspath(__file__), path]
+    if title:
+        command += ['--title', title]
+    if out:
+        command += ['--out', out]
+    return subprocess.Popen(command)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Plot a metrics log written during training')
+    parser.add_argument('path')
+    parser.add_argument('--title')
+    parser.add_argument('--out', help='image file, defaults to the log with a .png extension')
+    args = parser.parse_args()
+    plot_log(args.path, args.title, args.out)
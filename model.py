@@ -7,6 +7,9 @@ import numpy as np
 
 
 class Linear_QNet(nn.Module):
+    # default file of save() in ./model
+    file_name = 'model_new.pth'
+
     def __init__(self, input_size, hidden_size, output_size):
         """
         :param input_size: int
@@ -22,10 +25,11 @@ class Linear_QNet(nn.Module):
         x = self.linear2(x)
         return x
 
-    def save(self, file_name='model_new.pth'):
+    def save(self, file_name=None):
         """
-        :param file_name: str
+        :param file_name: str, the model's file_name if None
         """
+        file_name = file_name or self.file_name
         model_folder_path = './model'
         if not os.path.exists(model_folder_path):
             os.makedirs(model_folder_path)
@@ -34,6 +38,109 @@ class Linear_QNet(nn.Module):
         torch.save(self.state_dict(), file_name)
 
 
+class ConvQNet(nn.Module):
+    # its own file, so saving a grid model never replaces the Linear_QNet that evaluate.py and side_by_side.py load
+    file_name = 'model_grid.pth'
+
+    def __init__(self, channels, rows, cols, output_size=3):
+        """
+        Small convolutional Q network over the grid observation of state_encoder.encode_grid().
+        Accepts float or uint8 inputs of shape (channels, rows, cols) or (n, channels, rows, cols).
+        :param channels: int
+        :param rows: int
+        :param cols: int
+        :param output_size: int
+        """
+        super().__init__()
+        self.input_shape = (channels, rows, cols)
+        self.conv1 = nn.Conv2d(channels, 16, 3, padding=1)
+        self.conv2 = nn.Conv2d(16, 32, 3, stride=2, padding=1)
+        self.conv3 = nn.Conv2d(32, 32, 3, stride=2, padding=1)
+        # each stride 2 convolution halves the board, rounding up
+        self.linear1 = nn.Linear(32 * ((rows + 3) // 4) * ((cols + 3) // 4), 128)
+        self.linear2 = nn.Linear(128, output_size)
+
+    def forward(self, x):
+        single = x.dim() == 3
+        if single:
+            x = x.unsqueeze(0)
+        x = F.relu(self.conv1(x.float()))
+        x = F.relu(self.conv2(x))
+        x = F.relu(self.conv3(x))
+        x = F.relu(self.linear1(x.flatten(1)))
+        x = self.linear2(x)
+        return x.squeeze(0) if single else x
+
+    save = Linear_QNet.save
+
+
+class NumpyQNet:
+    def __init__(self, model):
+        """
+        Pure NumPy forward pass of a Linear_QNet. The weights are views of the model's parameters, so the optimizer's
+        in-place updates and load_state_dict() are seen without re-exporting.
+        :param model: Linear_QNet()
+        """
+        self.w1 = model.linear1.weight.detach().numpy()
+        self.b1 = model.linear1.bias.detach().numpy()
+        self.w2 = model.linear2.weight.detach().numpy()
+        self.b2 = model.linear2.bias.detach().numpy()
+        self.state = np.zeros(self.w1.shape[1], dtype=np.float32)
+        self.hidden = np.zeros(self.w1.shape[0], dtype=np.float32)
+
+    def __call__(self, state):
+        """
+        :param state: ndarray
+        :return: ndarray of Q values
+        """
+        self.state[:] = state
+        np.matmul(self.w1, self.state, out=self.hidden)
+        self.hidden += self.b1
+        np.maximum(self.hidden, 0, out=self.hidden)
+        return self.w2 @ self.hidden + self.b2
+
+
+def inference_policy(model, backend='torch'):
+    """
+    Greedy action function for acting without autograd.
+    'torch' runs the model under torch.inference_mode() on a reused input buffer, 'script' runs a TorchScript export
+    of it the same way and 'numpy' uses NumpyQNet. All three follow later updates of the model's weights in place.
+    A ConvQNet reads its float32 grid states through torch.from_numpy() without copying them.
+    :param model: Linear_QNet() or ConvQNet()
+    :param backend: str
+    :return: function mapping a state ndarray to the index of the best action
+    """
+    if isinstance(model, ConvQNet):
+        if backend == 'numpy':
+            raise ValueError('the numpy backend only supports Linear_QNet')
+        net = torch.jit.script(model) if backend == 'script' else model
+
+        def grid_policy(state):
+            with torch.inference_mode():
+                return int(torch.argmax(net(torch.from_numpy(state))))
+
+        return grid_policy
+
+    if backend == 'numpy':
+        net = NumpyQNet(model)
+        return lambda state: int(np.argmax(net(state)))
+    if backend == 'script':
+        net = torch.jit.script(model)
+    elif backend == 'torch':
+        net = model
+    else:
+        raise ValueError(f'unknown inference backend {backend!r}')
+
+    buffer = torch.zeros(model.linear1.in_features)
+
+    def policy(state):
+        with torch.inference_mode():
+            buffer.copy_(torch.from_numpy(np.asarray(state)))
+            return int(torch.argmax(net(buffer)))
+
+    return policy
+
+
 class QTrainer:
     def __init__(self, model, lr, gamma):
         """
@@ -46,6 +153,35 @@ class QTrainer:
         self.model = model
         self.optimizer = optim.Adam(model.parameters(), lr=self.lr)
         self.criterion = nn.MSELoss()
+        self.last_loss = None
+
+    @staticmethod
+    def to_tensors(state, action, reward, next_state, done):
+        """
+        Convert one transition or a sequence of transitions (as stored by Agent.remember) to batched tensors
+        :param state: ndarray
+        :param action: list[int]
+        :param reward: int
+        :param next_state: ndarray
+        :param done: bool
+        :return: tuple[Tensor, Tensor, Tensor, Tensor, Tensor] with shapes (n, x), (n,), (n,), (n, x), (n,)
+        """
+        state = torch.tensor(np.array(state), dtype=torch.float)
+        next_state = torch.tensor(np.array(next_state), dtype=torch.float)
+        action = torch.tensor(np.array(action), dtype=torch.long)
+        reward = torch.tensor(np.array(reward), dtype=torch.float)
+        done = torch.tensor(np.array(done), dtype=torch.bool)
+
+        if len(state.shape) == 1:
+            # (1, x)
+            state = torch.unsqueeze(state, 0)
+            next_state = torch.unsqueeze(next_state, 0)
+            action = torch.unsqueeze(action, 0)
+            reward = torch.unsqueeze(reward, 0)
+            done = torch.unsqueeze(done, 0)
+
+        # one-hot [straight, right, left] -> action index
+        return state, torch.argmax(action, dim=1), reward, next_state, done
 
     def train_step(self, state, action, reward, next_state, done):
         """
@@ -54,6 +190,57 @@ class QTrainer:
         :param reward: int
         :param next_state: ndarray
         :param done: bool
+        :return: Tensor of per-sample TD errors
+        """
+        return self.train_batch(*self.to_tensors(state, action, reward, next_state, done))
+
+    def train_batch(self, state, action, reward, next_state, done, weights=None, discounts=None):
+        """
+        Batched update: one forward pass over state and one over next_state.
+        Gives the same loss and gradients as train_step_reference() when weights is None.
+        The loss is stored in self.last_loss.
+        :param state: Tensor (n, x)
+        :param action: Tensor (n,) of action indices
+        :param reward: Tensor (n,)
+        :param next_state: Tensor (n, x)
+        :param done: Tensor (n,) of bools
+        :param weights: Tensor (n,) of importance-sampling weights, or None
+        :param discounts: Tensor (n,) of the discount of each next_state, e.g. gamma ** n for n-step returns, or None
+        for gamma
+        :return: Tensor (n,) of TD errors Q_new - Q(state, action)
+        """
+        # 1: predicted Q values with current state
+        pred = self.model(state)
+
+        # 2: Q_new = r + y * max(next_predicted Q value) -> only do this if not done
+        next_q = torch.max(self.model(next_state), dim=1).values
+        gamma = self.gamma if discounts is None else discounts
+        Q_new = torch.where(done, reward, reward + gamma * next_q)
+
+        # the target equals pred except at the action taken, so only those entries contribute to the MSE
+        pred_action = pred.gather(1, action.unsqueeze(1)).squeeze(1)
+        td_error = Q_new - pred_action
+        squared_error = td_error ** 2
+        if weights is not None:
+            squared_error = weights * squared_error
+        loss = torch.sum(squared_error) / pred.numel()
+
+        self.optimizer.zero_grad()
+        loss.backward()
+
+        self.optimizer.step()
+        self.last_loss = loss.item()
+        return td_error.detach()
+
+    def train_step_reference(self, state, action, reward, next_state, done):
+        """
+        Original per-sample implementation of train_step(), kept to check the batched path against
+        :param state: ndarray
+        :param action: list[int]
+        :param reward: int
+        :param next_state: ndarray
+        :param done: bool
+        :return: Tensor of per-sample TD errors
         """
         state = torch.tensor(np.array(state), dtype=torch.float)
         next_state = torch.tensor(np.array(next_state), dtype=torch.float)
@@ -88,3 +275,6 @@ class QTrainer:
         loss.backward()
 
         self.optimizer.step()
+        self.last_loss = loss.item()
+        actions = torch.argmax(action, dim=1, keepdim=True)
+        return (target.gather(1, actions) - pred.gather(1, actions)).squeeze(1).detach()
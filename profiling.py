@@ -0,0 +1,137 @@
+import cProfile
+import json
+import os
+import time
+
+
+class NullProfiler:
+    """
+    Stand-in used when profiling is off, every hook is a no-op
+    """
+
+    def mark(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def end_episode(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class TrainingProfiler(NullProfiler):
+
+    def __init__(self, path='results/profile.jsonl', flush_every=10, profile_episodes=None, profiler='cprofile'):
+        """
+        Per-phase timers and counters for the training loop, flushed as one JSON line every flush_every episodes.
+        Call mark() where a frame starts and lap(phase) at the end of each phase: the time since the previous mark or
+        lap is added to that phase, so each phase costs one monotonic clock read.
+        :param path: str, JSON lines file
+        :param flush_every: int, episodes per line
+        :param profile_episodes: tuple[int, int], run a profiler from the start of the first episode to the end of
+        the second (1-based), or None
+        :param profiler: str, 'cprofile' (writes <path>.prof) or 'torch' (writes <path>.trace.json)
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self.profile_episodes = profile_episodes
+        self.profiler = profiler
+        self._active_profiler = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'a')
+
+        self.episodes = 0
+        self.start = time.perf_counter_ns()
+        self._reset_window()
+        self._maybe_start_profiler()
+
+    def _reset_window(self):
+        self.phases = {}
+        self.calls = {}
+        self.counters = {}
+        self.window_start = time.perf_counter_ns()
+        self.last = self.window_start
+
+    def mark(self):
+        self.last = time.perf_counter_ns()
+
+    def lap(self, phase):
+        """
+        Charge the time since the last mark() or lap() to phase
+        :param phase: str
+        """
+        now = time.perf_counter_ns()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self.last
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        self.last = now
+
+    def count(self, name, n=1):
+        """
+        :param name: str, e.g. 'frames', 'train_steps' or 'samples'
+        :param n: int
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def end_episode(self):
+        self.episodes += 1
+        self.count('episodes')
+        if self.profile_episodes is not None and self.episodes == self.profile_episodes[1]:
+            self._stop_profiler()
+        if self.episodes % self.flush_every == 0:
+            self.flush()
+        self._maybe_start_profiler()
+
+    def flush(self):
+        """
+        Write the phases and counters of the current window as one JSON line and start a new window
+        """
+        seconds = (time.perf_counter_ns() - self.window_start) / 1e9
+        record = {
+            'episode': self.episodes,
+            'elapsed_s': (time.perf_counter_ns() - self.start) / 1e9,
+            'window_s': seconds,
+            'phases': {phase: {'s': ns / 1e9, 'calls': self.calls[phase]} for phase, ns in self.phases.items()},
+            'counters': self.counters,
+            'per_second': {name: n / seconds for name, n in self.counters.items()} if seconds > 0 else {},
+        }
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        self._reset_window()
+
+    def _maybe_start_profiler(self):
+        if self.profile_episodes is None or self._active_profiler is not None:
+            return
+        if self.episodes + 1 == self.profile_episodes[0]:
+            if self.profiler == 'torch':
+                import torch.profiler
+                self._active_profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU])
+                self._active_profiler.__enter__()
+            else:
+                self._active_profiler = cProfile.Profile()
+                self._active_profiler.enable()
+
+    def _stop_profiler(self):
+        if self._active_profiler is None:
+            return
+        if self.profiler == 'torch':
+            self._active_profiler.__exit__(None, None, None)
+            self._active_profiler.export_chrome_trace(self.path + '.trace.json')
+        else:
+            self._active_profiler.disable()
+            self._active_profiler.dump_stats(self.path + '.prof')
+        self._active_profiler = None
+        self.profile_episodes = None
+
+    def close(self):
+        self._stop_profiler()
+        if self.phases or self.counters:
+            self.flush()
+        self.file.close()
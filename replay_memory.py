@@ -0,0 +1,280 @@
+import numpy as np
+import torch
+
+
+class ReplayMemory:
+
+    def __init__(self, capacity, state_size, state_dtype=np.float32, seed=None):
+        """
+        Fixed-size ring buffer of transitions stored in preallocated NumPy arrays.
+        Once full, new transitions overwrite the oldest ones, like a deque with maxlen.
+        :param capacity: int
+        :param state_size: int or tuple[int]
+        :param state_dtype: numpy dtype
+        :param seed: int
+        """
+        state_shape = (state_size,) if isinstance(state_size, int) else tuple(state_size)
+        self.capacity = capacity
+        self.states = np.zeros((capacity,) + state_shape, dtype=state_dtype)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity,) + state_shape, dtype=state_dtype)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.position = 0  # next slot to write
+        self.size = 0
+        self.rng = np.random.default_rng(seed)
+        self._batch = None
+
+    def __len__(self):
+        return self.size
+
+    def append(self, state, action, reward, next_state, done):
+        """
+        Store one transition in O(1)
+        :param state: ndarray
+        :param action: list[int] one-hot [straight, right, left] or int index
+        :param reward: float
+        :param next_state: ndarray
+        :param done: bool
+        """
+        if isinstance(action, list):
+            action = action.index(1)
+        elif np.ndim(action):
+            action = np.argmax(action)
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def extend(self, states, actions, rewards, next_states, dones):
+        """
+        Store a batch of transitions with one copy per array, wrapping around the end of the buffer
+        :param states: ndarray or Tensor (n, x)
+        :param actions: ndarray or Tensor (n,) of action indices
+        :param rewards: ndarray or Tensor (n,)
+        :param next_states: ndarray or Tensor (n, x)
+        :param dones: ndarray or Tensor (n,)
+        :return: ndarray[int] of the slots written
+        """
+        n = len(actions)
+        idx = (self.position + np.arange(n)) % self.capacity
+        for array, values in zip(self.arrays(), (states, actions, rewards, next_states, dones)):
+            array[idx] = np.asarray(values)
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        return idx
+
+    def state_dict(self, copy=True):
+        """
+        Contents and sampling state of the memory, for checkpoints
+        :param copy: bool, copy the filled part of the arrays so later appends do not change the result
+        :return: dict
+        """
+        n = self.size
+        arrays = [a[:n].copy() if copy else a[:n] for a in self.arrays()]
+        return {'arrays': arrays, 'position': self.position, 'size': n, 'rng': self.rng.bit_generator.state}
+
+    def load_state_dict(self, state):
+        """
+        :param state: dict returned by state_dict(), of a memory with the same capacity
+        """
+        n = state['size']
+        for a, saved in zip(self.arrays(), state['arrays']):
+            a[:n] = saved
+        self.position = state['position']
+        self.size = n
+        self.rng.bit_generator.state = state['rng']
+
+    def _batch_buffers(self, batch_size):
+        """
+        Reusable arrays a sampled minibatch is gathered into
+        :param batch_size: int
+        :return: tuple[ndarray, ...]
+        """
+        if self._batch is None or len(self._batch[1]) != batch_size:
+            self._batch = tuple(np.empty((batch_size,) + a.shape[1:], dtype=a.dtype) for a in self.arrays())
+        return self._batch
+
+    def arrays(self):
+        """
+        :return: tuple[ndarray, ...] of state, action, reward, next_state and done storage
+        """
+        return self.states, self.actions, self.rewards, self.next_states, self.dones
+
+    def gather(self, idx):
+        """
+        Copy the transitions at idx into the reusable batch buffers
+        :param idx: ndarray[int]
+        :return: tuple[Tensor, ...] sharing memory with the batch buffers
+        """
+        batch = self._batch_buffers(len(idx))
+        for array, out in zip(self.arrays(), batch):
+            np.take(array, idx, axis=0, out=out)
+        return tuple(torch.from_numpy(b) for b in batch)
+
+    def sample(self, batch_size):
+        """
+        Sample batch_size transitions uniformly (with replacement), or return the whole memory if it holds no more
+        than batch_size transitions. The tensors are views that are overwritten by the next call to sample().
+        :param batch_size: int
+        :return: tuple[Tensor, ...] of states (n, x), action indices (n,), rewards (n,), next states (n, x), dones (n,)
+        """
+        if self.size <= batch_size:
+            return tuple(torch.from_numpy(a[:self.size]) for a in self.arrays())
+        return self.gather(self.rng.integers(0, self.size, batch_size))
+
+
+class SumTree:
+
+    def __init__(self, capacity):
+        """
+        Array-backed binary tree whose internal nodes hold the sum of their children's priorities.
+        Node 1 is the root and the leaves start at index self.leaves.
+        :param capacity: int
+        """
+        self.leaves = 1
+        while self.leaves < capacity:
+            self.leaves *= 2
+        self.tree = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def set(self, i, priority):
+        """
+        Set the priority of one data index in O(log n)
+        :param i: int
+        :param priority: float
+        """
+        node = i + self.leaves
+        self.tree[node] = priority
+        node //= 2
+        while node >= 1:
+            self.tree[node] = self.tree[2 * node] + self.tree[2 * node + 1]
+            node //= 2
+
+    def update(self, idx, priorities):
+        """
+        Set the priorities of many data indices at once, one vectorized pass per tree level
+        :param idx: ndarray[int]
+        :param priorities: ndarray[float]
+        """
+        nodes = np.asarray(idx) + self.leaves
+        self.tree[nodes] = priorities
+        while nodes[0] > 1:
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """
+        For each value in [0, total), walk down to the leaf whose prefix-sum interval contains it
+        :param values: ndarray[float]
+        :return: ndarray[int] data indices
+        """
+        nodes = np.ones(len(values), dtype=np.int64)
+        values = np.array(values, dtype=np.float64)
+        while nodes[0] < self.leaves:
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = values > left_sum
+            values -= np.where(go_right, left_sum, 0)
+            nodes = left + go_right
+        return nodes - self.leaves
+
+    def priorities(self, idx):
+        """
+        :param idx: ndarray[int]
+        :return: ndarray[float]
+        """
+        return self.tree[np.asarray(idx) + self.leaves]
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+
+    def __init__(self, capacity, state_size, alpha=0.6, beta=0.4, beta_increment=1e-3, eps=1e-3, **kwargs):
+        """
+        Replay memory that samples transitions in proportion to priority ** alpha (Schaul et al. 2016).
+        New transitions get the highest priority seen so far, so each is replayed at least once.
+        :param capacity: int
+        :param state_size: int or tuple[int]
+        :param alpha: float, 0 is uniform sampling
+        :param beta: float, importance-sampling exponent, annealed towards 1
+        :param beta_increment: float, added to beta after every sample
+        :param eps: float, keeps zero-error transitions sampleable
+        """
+        super().__init__(capacity, state_size, **kwargs)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.eps = eps
+        self.max_priority = 1.0
+        self.tree = SumTree(capacity)
+
+    def append(self, state, action, reward, next_state, done):
+        """
+        Store one transition with the current maximum priority
+        """
+        self.tree.set(self.position, self.max_priority)
+        super().append(state, action, reward, next_state, done)
+
+    def extend(self, states, actions, rewards, next_states, dones):
+        """
+        Store a batch of transitions with the current maximum priority
+        :return: ndarray[int] of the slots written
+        """
+        idx = super().extend(states, actions, rewards, next_states, dones)
+        self.tree.update(idx, np.full(len(idx), self.max_priority))
+        return idx
+
+    def sample(self, batch_size):
+        """
+        Proportional sample without the importance-sampling weights, see sample_weighted()
+        :param batch_size: int
+        :return: tuple[Tensor, ...]
+        """
+        return self.sample_weighted(batch_size)[0]
+
+    def sample_weighted(self, batch_size):
+        """
+        Stratified proportional sample: one index from each of batch_size equal slices of the total priority
+        :param batch_size: int
+        :return: tuple[tuple[Tensor, ...], ndarray, Tensor] of the batch, its indices and importance-sampling weights
+        """
+        batch_size = min(batch_size, self.size)
+        segment = self.tree.total / batch_size
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+        # rounding can walk past the last stored transition into an empty leaf
+        idx = np.minimum(self.tree.find(values), self.size - 1)
+
+        probabilities = self.tree.priorities(idx) / self.tree.total
+        weights = (self.size * probabilities) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return self.gather(idx), idx, torch.from_numpy(weights.astype(np.float32))
+
+    def state_dict(self, copy=True):
+        state = super().state_dict(copy)
+        state.update(tree=self.tree.tree.copy() if copy else self.tree.tree, beta=self.beta,
+                     max_priority=self.max_priority)
+        return state
+
+    def load_state_dict(self, state):
+        super().load_state_dict(state)
+        self.tree.tree[:] = state['tree']
+        self.beta = state['beta']
+        self.max_priority = state['max_priority']
+
+    def update_priorities(self, idx, td_errors):
+        """
+        Set the priorities of sampled transitions from their new TD errors
+        :param idx: ndarray[int]
+        :param td_errors: Tensor or ndarray
+        """
+        priorities = (np.abs(np.asarray(td_errors, dtype=np.float64)) + self.eps) ** self.alpha
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(idx, priorities)
@@ -0,0 +1,134 @@
+import math
+import numpy as np
+import torch
+
+
+def release_window(length):
+    """
+    Number of frames after eating during which short memory is not trained (the training gap of Wei et al.), since
+    the move towards the new food does not follow from the state before it appeared
+    :param length: int, length of the snake
+    :return: int
+    """
+    if length <= 10:
+        return 6
+    return math.floor(0.6 * length + 2)
+
+
+class UpdateScheduler:
+
+    def __init__(self, trainer, state_size=11, every=1, n_step=1, gamma=0.5, gap=True):
+        """
+        Buffers the transitions of the current game and trains the short memory on them in batches: every frames, and
+        at the end of each game. With n_step > 1 each transition is trained on its n-step return, so it waits until
+        the n - 1 transitions after it are known or the game ends.
+        Transitions made during the release window after the snake eats are left out.
+        :param trainer: QTrainer()
+        :param state_size: int or tuple[int], shape of a state
+        :param every: int, frames between updates, 1 trains on every frame like the original train_short_memory()
+        :param n_step: int
+        :param gamma: float, discount rate of the n-step returns
+        :param gap: bool, skip the frames of the release window
+        """
+        self.trainer = trainer
+        self.every = every
+        self.n_step = n_step
+        self.gamma = gamma
+        self.gap = gap
+        capacity = every + n_step
+        state_shape = (state_size,) if isinstance(state_size, int) else tuple(state_size)
+        self.states = np.zeros((capacity,) + state_shape, dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity,) + state_shape, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.skip = np.zeros(capacity, dtype=bool)
+        self.size = 0
+        self.since_update = 0
+        self.release_frame = 0
+        self.frame = 0
+        self.updates = 0
+        # discounts of the rewards of an n-step return
+        self.powers = gamma ** np.arange(n_step, dtype=np.float32)
+
+    def push(self, state, action, reward, next_state, done, ate=False, length=3):
+        """
+        :param state: ndarray
+        :param action: list[int] one-hot move or int index
+        :param reward: float
+        :param next_state: ndarray
+        :param done: bool
+        :param ate: bool, the snake ate on this frame
+        :param length: int, length of the snake after this frame
+        """
+        self.frame += 1
+        i = self.size
+        self.states[i] = state
+        self.actions[i] = action.index(1) if isinstance(action, list) else action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.skip[i] = self.gap and self.frame <= self.release_frame
+        self.size += 1
+        self.since_update += 1
+        if ate:
+            self.release_frame = self.frame + release_window(length)
+
+        if done:
+            self.flush(final=True)
+            self.frame = 0
+            self.release_frame = 0
+        elif self.since_update >= self.every:
+            self.flush()
+
+    def flush(self, final=False):
+        """
+        Train on the buffered transitions whose n-step returns are complete, all of them if final
+        :param final: bool, the game has ended
+        """
+        n = self.size if final else self.size - (self.n_step - 1)
+        self.since_update = 0
+        if n <= 0:
+            return
+        if self.n_step == 1:
+            keep = ~self.skip[:n]
+            rewards = self.rewards[:n]
+            next_states = self.next_states[:n]
+            dones = self.dones[:n]
+            discounts = None
+        else:
+            rewards, next_states, dones, discounts = self._n_step_returns(n)
+            keep = ~self.skip[:n]
+        if keep.any():
+            tensors = (torch.from_numpy(self.states[:n][keep]), torch.from_numpy(self.actions[:n][keep]),
+                       torch.from_numpy(rewards[keep]), torch.from_numpy(next_states[keep]),
+                       torch.from_numpy(dones[keep]))
+            if discounts is not None:
+                self.trainer.train_batch(*tensors, discounts=torch.from_numpy(discounts[keep]))
+            else:
+                self.trainer.train_batch(*tensors)
+            self.updates += 1
+
+        # move the transitions still waiting for their n-step return to the front
+        rest = self.size - n
+        for a in (self.states, self.actions, self.rewards, self.next_states, self.dones, self.skip):
+            a[:rest] = a[n:self.size]
+        self.size = rest
+
+    def _n_step_returns(self, n):
+        """
+        n-step returns of the first n buffered transitions, computed together: the discounted rewards up to n_step
+        frames ahead, stopping at the end of the game, bootstrapped from the next state of the last of those frames
+        :param n: int
+        :return: tuple[ndarray, ...] of returns, bootstrap states, dones and bootstrap discounts
+        """
+        # window[i, k] is the index of the k-th transition after i, clipped to the last buffered one
+        window = np.minimum(np.arange(n)[:, None] + np.arange(self.n_step), self.size - 1)
+        # a transition only sees rewards up to and including the first done in its window
+        done_before = np.cumsum(self.dones[window], axis=1) - self.dones[window]
+        valid = (done_before == 0) & (np.arange(n)[:, None] + np.arange(self.n_step) < self.size)
+        returns = (self.rewards[window] * self.powers * valid).sum(axis=1, dtype=np.float32)
+        steps = valid.sum(axis=1)
+        last = window[np.arange(n), steps - 1]
+        discounts = (self.gamma ** steps).astype(np.float32)
+        return returns, self.next_states[last], self.dones[last], discounts
@@ -1,11 +1,13 @@
-from agent import Agent, train
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from game import SnakeGameAI
-import torch
 from enum import Enum
-from model import Linear_QNet
 import pygame
 from snake_game_human import SnakeGame as SnakeGameHuman
 
+PRETRAINED_MODEL = 'model/model_new.pth'
+
 
 class Direction(Enum):
     RIGHT = 1
@@ -14,21 +16,106 @@ class Direction(Enum):
     DOWN = 4
 
 
-def play():
+def find_pretrained():
+    """
+    :return: str, the most recently written of the checkpoints of train() and PRETRAINED_MODEL, or None if there is
+    none
+    """
+    from checkpoint import list_checkpoints
+
+    paths = list_checkpoints()
+    if os.path.exists(PRETRAINED_MODEL):
+        paths.append(PRETRAINED_MODEL)
+    return max(paths, key=os.path.getmtime, default=None)
+
+
+def load_ai(path=None):
+    """
+    Import torch and load the AI. Most of the time goes into the imports, so play() runs this on a background thread
+    while the player reads the first prompt.
+    The AI plays greedily, even when loaded from a checkpoint taken during its exploration games.
+    :param path: str, checkpoint or saved model weights, see agent.load_agent(), or None for find_pretrained()
+    :return: Agent(), or None if there is nothing to load
+    """
+    from agent import load_agent
+
+    if path is None:
+        path = find_pretrained()
+    if path is None:
+        return None
+    agent = load_agent(path)
+    agent.n_games = max(agent.n_games, agent.epsilon_start)
+    return agent
+
+
+class BackgroundLearner:
+
+    def __init__(self, agent, max_updates=200):
+        """
+        Trains the agent's long memory on a background thread between rounds, so learning from the last round does
+        not delay the next one. It is stopped before each round, so the game loop and the learner never use the model
+        or the replay memory at the same time.
+        :param agent: Agent()
+        :param max_updates: int, long memory updates after each round
+        """
+        self.agent = agent
+        self.max_updates = max_updates
+        self.updates = 0
+        self.error = None
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._learn, daemon=True)
+        self.thread.start()
+
+    def _learn(self):
+        try:
+            for _ in range(self.max_updates):
+                if self.stopping.is_set():
+                    return
+                self.agent.train_long_memory()
+                self.updates += 1
+        except Exception as e:
+            self.error = e
+
+    def stop(self):
+        """
+        Wait for the update in progress to finish
+        """
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            raise self.error
+
+
+def play(path=None, learn=False, updates=200, train_games=100):
     """
     Displays two game boards, AI and human, which play side by side. When the first one loses, both games are ended
     and the opposite player wins.
+    The AI is loaded from path, or the newest checkpoint or saved model, and is only trained first if there is none.
+    :param path: str, checkpoint or saved model weights, see agent.load_agent()
+    :param learn: bool, keep the AI's moves and train on them in the background between rounds
+    :param updates: int, long memory updates after each round when learning
+    :param train_games: int, games to train a new AI for when there is nothing to load
     """
-    # saved_model = Linear_QNet(11, 256, 3)
-    # saved_model.load_state_dict(torch.load('model/model_new.pth'))  # load a pretrained AI model (didn't work, have to use model in-memory)
-    # saved_model.eval()
-    print('Training AI. Please wait for 2-5 minutes...')
-    agent = train(n_games=100)
-    # game_human = threading.Thread(target=SnakeGameHuman, args={"rightPosition": True})
+    with ThreadPoolExecutor(1) as pool:
+        loading = pool.submit(load_ai, path)
+        user_input = input('Play game? Y/N\n')
+        agent = loading.result()
+    if agent is None:
+        from agent import train
 
-    user_input = input('Play game? Y/N\n')
+        print('No pretrained AI found. Training AI. Please wait for 2-5 minutes...')
+        agent = train(n_games=train_games)
+    learner = BackgroundLearner(agent, updates) if learn else None
 
     while user_input != 'N':
+        if learner is not None:
+            learner.stop()
         pygame.init()
         game_ai = SnakeGameAI(visual=True)
         game_human = SnakeGameHuman(rightPosition=True)
@@ -43,30 +130,41 @@ def play():
             # perform move and get new state
             reward_ai, done_ai, score_ai = game_ai.play_step(final_move)
 
-            state_new = agent.get_state(game_ai)
-
-            agent.train_short_memory(game_ai, state_old, final_move, reward_ai, state_new, done_ai)
-
-            agent.remember(state_old, final_move, reward_ai, state_new, done_ai)
+            if learner is not None:
+                agent.remember(state_old, final_move, reward_ai, agent.get_state(game_ai), done_ai)
 
             # human
             done_human, score_human = game_human.play_step()
 
             if done_ai:
                 print("Human won")
-                print("Want a real challenge? Try higher speeds, or increase the AI's epochs so that it has more than 2 minutes to learn.")
+                print("Want a real challenge? Try higher speeds, or let the AI learn from more games.")
                 break
 
             if done_human:
                 print("AI won")
                 print("No surprises here.")
                 break
-        
-        agent.train_long_memory()
+
+        if learner is not None:
+            learner.start()
 
         user_input = input('Play game again? Y/N\n')
-        
+
         # pygame.quit()
 
+    if learner is not None:
+        learner.stop()
+
+
 if __name__ == '__main__':
-    play()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Play against the AI side by side')
+    parser.add_argument('--model', help='checkpoint or saved model to play against, the newest one by default')
+    parser.add_argument('--learn', action='store_true', help='let the AI keep learning in the background between rounds')
+    parser.add_argument('--updates', type=int, default=200, help='long memory updates after each round')
+    parser.add_argument('--train-games', type=int, default=100, help='games to train for if there is nothing to load')
+    args = parser.parse_args()
+
+    play(args.model, args.learn, args.updates, args.train_games)
@@ -1,95 +1,134 @@
-facingDirections = [[-1, 0], [0, 1], [1, 0], [0, -1]]
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from game import facingDirections
+from smoothness_tables import SOURCE, UNREACHABLE, NO_GRAPH, write_tables
 
-rows = 26
-cols = 34
+FACING = np.array(facingDirections)
 
-f = open('smoothnessGraphs.txt', 'w')
-f = open('smoothnessGraphs.txt', 'a')
 
-
-def new_point(loc, new_dist, new_dir, stack, empty_board, min_to_wall):
+def starting_directions(rows, cols):
     """
-    Updates one point of the graph.
-    Adds neighbouring points to stack if they have a lower score.
-    Also saves min_to_wall score.
-    :param loc: list[int]
-    :param new_dist: int
-    :param new_dir: int
-    :param stack: bool
-    :param empty_board: list[list[int]]
-    :param min_to_wall: list[int]
+    Mask of the (row, col, direction) triples that get a smoothness graph.
+    Cells next to a wall have no graph for the direction that points into it,
+    so the cells located near walls have either 2 or 3 smoothness graphs and other cells have 4.
+    :param rows: int
+    :param cols: int
+    :return: ndarray[bool] of shape (rows, cols, 4)
     """
-    straight_loc = [loc[0] + facingDirections[new_dir][0], loc[1] + facingDirections[new_dir][1]]
-    if 0 <= straight_loc[0] < rows and 0 <= straight_loc[1] < cols:
-        if straight_loc[0] == 0 or straight_loc[0] == rows - 1 or straight_loc[1] == 0 or straight_loc[1] == cols - 1:
-            min_to_wall[0] = min(min_to_wall[0], new_dist)
-        if empty_board[straight_loc[0]][straight_loc[1]] > new_dist:
-            empty_board[straight_loc[0]][straight_loc[1]] = new_dist
-            stack.append([straight_loc, new_dir, new_dist, True])
+    mask = np.ones((rows, cols, 4), dtype=bool)
+    mask[0, :, 0] = False
+    mask[:, cols - 1, 1] = False
+    mask[rows - 1, :, 2] = False
+    mask[:, 0, 3] = False
+    return mask
 
 
-def smoothness_rating(headx, heady, direction):
+def _shift(planes, direction):
     """
-    Receives starting point (headx, heady) and direction to travel.
-    Creates empty graph with each point initialized to infinity smoothness score.
-    Uses stack to repeatedly call new_point function to update graph, 
-    till the full smoothness graph has been generated.
-    :param headx: int
-    :param heady: int
+    Move every set cell of planes one step in direction, dropping cells that leave the board
+    :param planes: ndarray[bool] of shape (n, rows, cols)
     :param direction: int
+    :return: ndarray[bool]
+    """
+    dr, dc = FACING[direction]
+    rows, cols = planes.shape[1:]
+    shifted = np.zeros_like(planes)
+    shifted[:, max(dr, 0):rows + min(dr, 0), max(dc, 0):cols + min(dc, 0)] = \
+        planes[:, max(-dr, 0):rows + min(-dr, 0), max(-dc, 0):cols + min(-dc, 0)]
+    return shifted
+
+
+def smoothness_boards(heads, directions, rows, cols):
+    """
+    Turn-constrained distance boards for a batch of starting points, computed together with one breadth-first search
+    over (cell, direction) states. The first move goes straight in the starting direction, after which every move
+    goes straight or turns left or right, never back.
+    :param heads: ndarray[int] of shape (n, 2), (row, col) of each start
+    :param directions: ndarray[int] of shape (n,)
+    :param rows: int
+    :param cols: int
+    :return: tuple[ndarray, ndarray] of distance boards (n, rows, cols) and min distance to wall (n,)
     """
-    stack = [[[headx, heady], direction, 0, False]]  # location, directionFacing, distance, can go left/right
-    emptyBoard = [[float('inf') for _ in range(cols)] for _ in range(rows)]
-    emptyBoard[stack[0][0][0]][stack[0][0][1]] = 0
-    minToWall = [float('inf')]
-    if headx == 0 or headx == rows - 1 or heady == 0 or heady == cols - 1:
-        minToWall[0] = 0
-    while len(stack) > 0:
-        loc, dir, dist, lr = stack.pop()
-        new_point(loc, dist + 1, dir, stack, emptyBoard, minToWall)
-        if lr:
-            new_point(loc, dist + 1, (dir + 1) % 4, stack, emptyBoard, minToWall)
-            new_point(loc, dist + 1, (dir - 1) % 4, stack, emptyBoard, minToWall)
-
-    strBoard = ";".join([",".join([str(i) for i in eb]) for eb in emptyBoard])
-    f.write(f"{headx}_{heady}_{direction}_{minToWall[0]}_{strBoard}\n")
+    n = len(heads)
+    starts = np.arange(n)
+    boards = np.full((n, rows, cols), UNREACHABLE, dtype=np.int16)
+    boards[starts, heads[:, 0], heads[:, 1]] = 0
+
+    # frontier[s, d] marks the cells reached at the current distance while facing d
+    frontier = np.zeros((n, 4, rows, cols), dtype=bool)
+    first = heads + FACING[directions]
+    on_board = (first[:, 0] >= 0) & (first[:, 0] < rows) & (first[:, 1] >= 0) & (first[:, 1] < cols)
+    s = starts[on_board]
+    frontier[s, directions[on_board], first[on_board, 0], first[on_board, 1]] = True
+    visited = frontier.copy()
+
+    dist = 1
+    while frontier.any():
+        reached = frontier.any(axis=1) & (boards == UNREACHABLE)
+        boards[reached] = dist
+
+        new = np.empty_like(frontier)
+        for d in range(4):
+            # facing d can be entered from any direction except the opposite one
+            incoming = frontier[:, d] | frontier[:, (d + 1) % 4] | frontier[:, (d - 1) % 4]
+            new[:, d] = _shift(incoming, d)
+        frontier = new & ~visited
+        visited |= frontier
+        dist += 1
+
+    edge = np.zeros((rows, cols), dtype=bool)
+    edge[[0, -1], :] = True
+    edge[:, [0, -1]] = True
+    min_to_wall = np.where(edge, boards, UNREACHABLE).min(axis=(1, 2))
+    return boards, min_to_wall
+
+
+def _generate_rows(args):
+    """
+    Smoothness graphs of all starting cells in rows [first_row, last_row)
+    :param args: tuple[int, int, int, int]
+    :return: tuple[ndarray, ndarray]
+    """
+    first_row, last_row, rows, cols = args
+    mask = starting_directions(rows, cols)[first_row:last_row]
+    r, c, d = np.nonzero(mask)
+    boards, min_to_wall = smoothness_boards(np.stack([r + first_row, c], axis=1), d, rows, cols)
+
+    ratings = np.zeros((last_row - first_row, cols, 4, rows, cols), dtype=np.int16)
+    walls = np.full((last_row - first_row, cols, 4), NO_GRAPH, dtype=np.int16)
+    ratings[r, c, d] = boards
+    walls[r, c, d] = min_to_wall
+    return ratings, walls
+
+
+def generate(rows, cols, processes=None, rows_per_task=2):
+    """
+    Generate the smoothness graphs of every (row, col, direction) of a rows x cols board, spread over a process pool
+    :param rows: int
+    :param cols: int
+    :param processes: int, defaults to the number of CPUs
+    :param rows_per_task: int
+    :return: tuple[ndarray, ndarray] of ratings [row, col, dir, r, c] and min distance to wall [row, col, dir]
+    """
+    tasks = [(i, min(i + rows_per_task, rows), rows, cols) for i in range(0, rows, rows_per_task)]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        chunks = list(pool.map(_generate_rows, tasks))
+    ratings = np.concatenate([chunk[0] for chunk in chunks])
+    walls = np.concatenate([chunk[1] for chunk in chunks])
+    return ratings, walls
 
 
 if __name__ == "__main__":
-    # Generates smoothness graphs
-    # The cells located near walls have either 2 or 3 smoothness graphs, based on the provided conditions
-    # Other cells have 4 smoothness graphs, one for each direction
-
-    for i in range(rows):
-        for j in range(cols):
-            if i == 0 and j == 0:
-                smoothness_rating(i, j, 1)
-                smoothness_rating(i, j, 2)
-            elif i == 0 and j == cols - 1:
-                smoothness_rating(i, j, 2)
-                smoothness_rating(i, j, 3)
-            elif i == rows - 1 and j == 0:
-                smoothness_rating(i, j, 0)
-                smoothness_rating(i, j, 1)
-            elif i == rows - 1 and j == cols - 1:
-                smoothness_rating(i, j, 0)
-                smoothness_rating(i, j, 3)
-            elif i == 0:
-                smoothness_rating(i, j, 1)
-                smoothness_rating(i, j, 2)
-                smoothness_rating(i, j, 3)
-            elif i == rows - 1:
-                smoothness_rating(i, j, 0)
-                smoothness_rating(i, j, 1)
-                smoothness_rating(i, j, 3)
-            elif j == 0:
-                smoothness_rating(i, j, 0)
-                smoothness_rating(i, j, 1)
-                smoothness_rating(i, j, 2)
-            elif j == cols - 1:
-                smoothness_rating(i, j, 0)
-                smoothness_rating(i, j, 2)
-                smoothness_rating(i, j, 3)
-            else:
-                for d in range(4):
-                    smoothness_rating(i, j, d)
+    parser = argparse.ArgumentParser(description='Generate the smoothness graphs used by SnakeGameAI')
+    # the defaults match the 24x32 cell board of SnakeGameAI(640, 480)
+    parser.add_argument('--rows', type=int, default=24)
+    parser.add_argument('--cols', type=int, default=32)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--source', default=SOURCE, help='the tables are written next to this file name')
+    args = parser.parse_args()
+
+    ratings, walls = generate(args.rows, args.cols, processes=args.processes)
+    write_tables(ratings, walls, args.source, {'generated': {'rows': args.rows, 'cols': args.cols}})
+    print(f'Wrote {args.rows}x{args.cols} smoothness graphs next to {os.path.abspath(args.source)}')
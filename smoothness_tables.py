@@ -0,0 +1,106 @@
+import json
+import os
+import numpy as np
+
+SOURCE = 'smoothnessGraphs.txt'
+
+# value of a cell that cannot be reached, and min distance to wall of a (row, col, direction) without a graph
+UNREACHABLE = np.iinfo(np.int16).max
+NO_GRAPH = -1
+
+
+def cache_paths(source=SOURCE):
+    """
+    Binary cache files that belong to a smoothness graph text file
+    :param source: str
+    :return: tuple[str, str, str] of ratings, min distance to wall and stamp paths
+    """
+    base = os.path.splitext(source)[0]
+    return base + '.ratings.npy', base + '.walls.npy', base + '.stamp.json'
+
+
+def parse_text(source=SOURCE):
+    """
+    Parse the text written by the original smoothnessGenerate.py.
+    Each line is row_col_direction_minDistToWall_board with the board as ';' separated rows of ',' separated ints.
+    :param source: str
+    :return: tuple[ndarray, ndarray] of ratings [row, col, dir, r, c] and min distance to wall [row, col, dir]
+    """
+    entries = []
+    with open(source) as file:
+        for line in file:
+            if len(line.strip()) > 0:
+                row, col, direction, min_dist, board = line.split("_")
+                board = board.strip()
+                values = np.array(board.replace(";", ",").split(","), dtype=np.float64)
+                entries.append((int(row), int(col), int(direction), float(min_dist), board.count(";") + 1, values))
+
+    rows = max(e[0] for e in entries) + 1
+    cols = max(e[1] for e in entries) + 1
+    ratings = np.zeros((rows, cols, 4, rows, cols), dtype=np.int16)
+    walls = np.full((rows, cols, 4), NO_GRAPH, dtype=np.int16)
+    for row, col, direction, min_dist, board_rows, values in entries:
+        values[np.isinf(values)] = UNREACHABLE
+        ratings[row, col, direction] = values.reshape(board_rows, -1)
+        walls[row, col, direction] = min(min_dist, UNREACHABLE)
+    return ratings, walls
+
+
+def _source_stamp(source):
+    stat = os.stat(source)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _save_atomic(file_name, array):
+    # write next to the target and rename, so a process opening the cache never sees a partial file
+    tmp = f'{file_name}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as file:
+        np.save(file, array)
+    os.replace(tmp, file_name)
+
+
+def write_tables(ratings, walls, source=SOURCE, stamp=None):
+    """
+    Write the binary cache for source
+    :param ratings: ndarray
+    :param walls: ndarray
+    :param source: str
+    :param stamp: dict describing the text file the tables came from, or {'generated': ...} for generated tables
+    """
+    ratings_path, walls_path, stamp_path = cache_paths(source)
+    _save_atomic(ratings_path, ratings.astype(np.int16))
+    _save_atomic(walls_path, walls.astype(np.int16))
+    tmp = f'{stamp_path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as file:
+        json.dump(stamp, file)
+    os.replace(tmp, stamp_path)
+
+
+def _cache_is_fresh(source):
+    ratings_path, walls_path, stamp_path = cache_paths(source)
+    if not (os.path.exists(ratings_path) and os.path.exists(walls_path) and os.path.exists(stamp_path)):
+        return False
+    if not os.path.exists(source):
+        # tables written directly by smoothnessGenerate.py, there is no text to compare against
+        return True
+    with open(stamp_path) as file:
+        stamp = json.load(file)
+    if 'generated' in stamp:
+        # tables written by smoothnessGenerate.py take precedence over an older text file
+        return os.stat(source).st_mtime_ns <= os.stat(stamp_path).st_mtime_ns
+    return stamp == _source_stamp(source)
+
+
+def load_smoothness_tables(source=SOURCE):
+    """
+    Open the smoothness graphs as read-only memory maps, so every process shares the same pages.
+    The binary cache is rebuilt from source first if it is missing or source has changed since it was written.
+    Tables written by smoothnessGenerate.py are used as they are unless source is newer.
+    :param source: str
+    :return: tuple[ndarray, ndarray] of ratings [row, col, dir, r, c] and min distance to wall [row, col, dir]
+    """
+    if not _cache_is_fresh(source):
+        ratings, walls = parse_text(source)
+        write_tables(ratings, walls, source, _source_stamp(source))
+    ratings_path, walls_path, _ = cache_paths(source)
+    return np.load(ratings_path, mmap_mode='r'), np.load(walls_path, mmap_mode='r')
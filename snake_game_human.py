@@ -1,22 +1,12 @@
 import pygame
 import random
-from enum import Enum
-from collections import namedtuple
 from pygame._sdl2 import Window, Renderer, Texture
+from game import Direction, Point, CLOCK_WISE, REWARDS, IDLE_FRAMES, SnakeGameAI, timeout_penalty, distance_reward
 
 pygame.init()
 font = pygame.font.Font('arial.ttf', 25)
 
 
-class Direction(Enum):
-    RIGHT = 1
-    LEFT = 2
-    UP = 3
-    DOWN = 4
-
-
-Point = namedtuple('Point', 'x, y')
-
 # rgb colors
 WHITE = (255, 255, 255, 255)
 RED = (200, 0, 0, 255)
@@ -65,6 +55,8 @@ class SnakeGame:
         self.score = 0
         self.food = None
         self._place_food()
+        self.frame_timeout_period = 0
+        self.reward = 0
 
     def _place_food(self):
         x = random.randint(0, (self.w - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
@@ -74,6 +66,14 @@ class SnakeGame:
             self._place_food()
 
     def play_step(self):
+        """
+        Move the snake in the direction of the last arrow key. The reward of the move, by the rules and default REWARDS
+        of SnakeGameAI.play_step() without the smoothness bonus, is kept in self.reward. As there, the game also ends
+        after IDLE_FRAMES frames without food.
+        :return: tuple[bool, int] of game over and score
+        """
+        self.frame_timeout_period += 1
+
         # 1. collect user input
         for event in self.pygame.event.get():
             if event.type == self.pygame.QUIT:
@@ -90,6 +90,7 @@ class SnakeGame:
                     self.direction = Direction.DOWN
 
         # 2. move
+        old_head = self.head
         self._move(self.direction)  # update the head
         self.snake.insert(0, self.head)
 
@@ -97,14 +98,25 @@ class SnakeGame:
         game_over = False
         if self._is_collision():
             game_over = True
+            self.reward = REWARDS['death']
+            return game_over, self.score
+
+        self.reward = timeout_penalty(len(self.snake), self.frame_timeout_period)
+        if self.frame_timeout_period == IDLE_FRAMES:
+            game_over = True
+            self.reward += REWARDS['idle']
             return game_over, self.score
 
         # 4. place new food or just move
         if self.head == self.food:
             self.score += 1
+            self.frame_timeout_period = 0
+            self.reward += REWARDS['food']
             print(f'Human score: {self.score}')
             self._place_food()
         else:
+            self.reward += distance_reward(len(self.snake), SnakeGameAI.distance(old_head, self.food),
+                                           SnakeGameAI.distance(self.head, self.food))
             self.snake.pop()
 
         # 5. update ui and clock
@@ -113,6 +125,14 @@ class SnakeGame:
         # 6. return game over and score
         return game_over, self.score
 
+    def is_blocked(self, pt):
+        """
+        Whether pt is outside the board or on the snake, so Agent.get_state() can read the state of a human game
+        :param pt: Point()
+        :return: bool
+        """
+        return pt.x > self.w - BLOCK_SIZE or pt.x < 0 or pt.y > self.h - BLOCK_SIZE or pt.y < 0 or pt in self.snake
+
     def _is_collision(self):
         # hits boundary
         if self.head.x > self.w - BLOCK_SIZE or self.head.x < 0 or self.head.y > self.h - BLOCK_SIZE or self.head.y < 0:
@@ -163,16 +183,51 @@ class SnakeGame:
         self.head = Point(x, y)
 
 
+def relative_action(old_direction, new_direction):
+    """
+    The SnakeGameAI action that turns old_direction into new_direction
+    :param old_direction: Direction
+    :param new_direction: Direction
+    :return: list[int], or None for a reversal, which SnakeGameAI cannot make
+    """
+    turn = (CLOCK_WISE.index(new_direction) - CLOCK_WISE.index(old_direction)) % 4
+    return {0: [1, 0, 0], 1: [0, 1, 0], 3: [0, 0, 1]}.get(turn)
+
+
 if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Play snake with the arrow keys')
+    parser.add_argument('--record', help='dataset directory to append the transitions of the game to, see dataset.py')
+    args = parser.parse_args()
+
     game = SnakeGame()
+    writer = None
+    if args.record:
+        from agent import Agent
+        from dataset import DatasetWriter
+        writer = DatasetWriter(args.record)
 
     # game loop
     while True:
+        if writer is not None:
+            state = Agent.get_state(game)
+            direction = game.direction
+
         game_over, score = game.play_step()
 
+        if writer is not None:
+            action = relative_action(direction, game.direction)
+            # a reversal runs into the neck, it has no SnakeGameAI action and is left out
+            if action is not None:
+                writer.append(state, action, game.reward, Agent.get_state(game), game_over)
+
         if game_over:
             break
 
+    if writer is not None:
+        writer.close()
+
     print('Final Score', score)
 
     pygame.quit()
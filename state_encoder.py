@@ -0,0 +1,121 @@
+import numpy as np
+from game import CLOCK_WISE_DELTAS, CLOCK_WISE_INDEX, GRID_PAD, norm
+
+STATE_SIZE = 11
+# channels of encode_grid(): body, head, food, then one plane per direction in clockwise order
+GRID_CHANNELS = 7
+
+# DANGER_OFFSETS[d] holds the (row, col) offsets of the cells straight ahead, right and left of a head facing d
+DANGER_OFFSETS = np.stack([CLOCK_WISE_DELTAS[[d, (d + 1) % 4, (d - 1) % 4]] for d in range(4)])
+_DANGER_OFFSETS = DANGER_OFFSETS.tolist()
+
+# DIRECTION_FEATURES[d] holds the move direction features (left, right, up, down) of a head facing d
+DIRECTION_FEATURES = np.array([[0, 1, 0, 0], [0, 0, 0, 1], [1, 0, 0, 0], [0, 0, 1, 0]], dtype=np.float32)
+
+
+def encode_state(game, out):
+    """
+    Write the state of Agent.get_state(game) into out, with table lookups in the game's occupancy grid
+    :param game: SnakeGameAI()
+    :param out: ndarray[float32] of shape (11,)
+    :return: out
+    """
+    d = CLOCK_WISE_INDEX[game.direction]
+    head = game.head
+    row = norm(head.y) + GRID_PAD
+    col = norm(head.x) + GRID_PAD
+    grid = game.grid
+    (r0, c0), (r1, c1), (r2, c2) = _DANGER_OFFSETS[d]
+    out[0] = grid[row + r0, col + c0] != 0  # danger straight
+    out[1] = grid[row + r1, col + c1] != 0  # danger right
+    out[2] = grid[row + r2, col + c2] != 0  # danger left
+    out[3:7] = DIRECTION_FEATURES[d]
+    food = game.food
+    out[7] = food.x < head.x  # food left
+    out[8] = food.x > head.x  # food right
+    out[9] = food.y < head.y  # food up
+    out[10] = food.y > head.y  # food down
+    return out
+
+
+def grid_shape(game):
+    """
+    :param game: SnakeGameAI()
+    :return: tuple[int, int, int] shape of the grid observation of game
+    """
+    return GRID_CHANNELS, game.rows, game.cols
+
+
+def encode_grid(game, out):
+    """
+    Write the board of game into out as planes of 0 and 1: the snake's body, its head, the food and the plane of its
+    direction. Everything is written in place, so out can be handed to torch.from_numpy() once and reused.
+    :param game: SnakeGameAI()
+    :param out: ndarray[float32] of shape grid_shape(game)
+    :return: out
+    """
+    np.copyto(out[0], game.body_grid)
+    out[1:].fill(0)
+    row, col = norm(game.head.y), norm(game.head.x)
+    # after a fatal move the head can be off the board
+    if 0 <= row < game.rows and 0 <= col < game.cols:
+        out[1, row, col] = 1
+    out[2, norm(game.food.y), norm(game.food.x)] = 1
+    out[3 + CLOCK_WISE_INDEX[game.direction]].fill(1)
+    return out
+
+
+class StateEncoder:
+
+    def __init__(self, n_games, rows, cols, pad=1):
+        """
+        Computes the states of a batch of games at once from their padded occupancy grids.
+        The index and lookup buffers are allocated once, so encode() does not allocate arrays.
+        :param n_games: int
+        :param rows: int
+        :param cols: int
+        :param pad: int, width of the wall border of the grids
+        """
+        self.n_games = n_games
+        self.pad = pad
+        self.width = cols + 2 * pad
+        grid_size = (rows + 2 * pad) * self.width
+        # offsets of the danger cells in a flattened grid, and of each game's grid in the flattened batch
+        self.danger_offsets = DANGER_OFFSETS[:, :, 0] * self.width + DANGER_OFFSETS[:, :, 1]
+        self.game_offsets = np.arange(n_games) * grid_size + pad * self.width + pad
+        self.cells = np.empty(n_games, dtype=np.int64)
+        self.danger_cells = np.empty((n_games, 3), dtype=np.int64)
+        self.danger = np.empty((n_games, 3), dtype=np.uint8)
+        self.features = np.empty((n_games, 4), dtype=np.float32)
+
+    def encode(self, grids, heads, directions, food, out):
+        """
+        :param grids: ndarray[uint8] of shape (n_games, rows + 2 * pad, cols + 2 * pad), non-zero where blocked
+        :param heads: ndarray[int] of shape (n_games, 2), (row, col) of each head
+        :param directions: ndarray[int] of shape (n_games,), clockwise index of each direction, see game.CLOCK_WISE
+        :param food: ndarray[int] of shape (n_games, 2), (row, col) of each food
+        :param out: ndarray[float32] of shape (n_games, 11)
+        :return: out
+        """
+        np.multiply(heads[:, 0], self.width, out=self.cells)
+        self.cells += heads[:, 1]
+        self.cells += self.game_offsets
+        np.take(self.danger_offsets, directions, axis=0, out=self.danger_cells)
+        self.danger_cells += self.cells[:, None]
+        np.take(grids.reshape(-1), self.danger_cells, out=self.danger)
+        np.not_equal(self.danger, 0, out=out[:, :3])
+        np.take(DIRECTION_FEATURES, directions, axis=0, out=self.features)
+        out[:, 3:7] = self.features
+        np.less(food[:, 1], heads[:, 1], out=out[:, 7])
+        np.greater(food[:, 1], heads[:, 1], out=out[:, 8])
+        np.less(food[:, 0], heads[:, 0], out=out[:, 9])
+        np.greater(food[:, 0], heads[:, 0], out=out[:, 10])
+        return out
+
+    def encode_vec(self, game, out):
+        """
+        :param game: VecSnakeGame()
+        :param out: ndarray[float32] of shape (n_games, 11)
+        :return: out
+        """
+        return self.encode(game.grid, game.head, game.direction, game.food, out)
@@ -0,0 +1,172 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing as mp
+
+# keyword arguments of Agent(), the other keys of a configuration are rewards of SnakeGameAI, see game.REWARDS
+AGENT_KEYS = ['lr', 'batch_size', 'max_memory', 'gamma', 'epsilon_start', 'update_every', 'n_step', 'training_gap',
+              'observation']
+METRICS = ['record', 'mean_score', 'max_iteration', 'avg_iteration']
+
+
+def grid(spec):
+    """
+    Every combination of the values of spec
+    :param spec: dict of parameter name to list of values
+    :return: list[dict]
+    """
+    names = list(spec)
+    return [dict(zip(names, values)) for values in itertools.product(*(spec[name] for name in names))]
+
+
+def random_search(spec, samples, seed=0):
+    """
+    Configurations with each parameter drawn independently from its values in spec.
+    A value given as {"log_uniform": [low, high]} or {"uniform": [low, high]} is drawn from that range instead.
+    :param spec: dict of parameter name to list of values or range
+    :param samples: int
+    :param seed: int
+    :return: list[dict]
+    """
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(samples):
+        config = {}
+        for name, values in spec.items():
+            if isinstance(values, dict) and 'log_uniform' in values:
+                low, high = values['log_uniform']
+                config[name] = low * (high / low) ** rng.random()
+            elif isinstance(values, dict) and 'uniform' in values:
+                config[name] = rng.uniform(*values['uniform'])
+            else:
+                config[name] = rng.choice(values)
+        configs.append(config)
+    return configs
+
+
+def limit_threads(threads):
+    """
+    Limit the threads of each worker, so parallel runs do not oversubscribe the CPUs
+    :param threads: int
+    """
+    for var in ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']:
+        os.environ[var] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+
+
+def run_config(config, seed, n_games):
+    """
+    Train one configuration with one seed, without saving models or results
+    :param config: dict
+    :param seed: int
+    :param n_games: int
+    :return: dict of the configuration, seed, metrics and run time
+    """
+    from agent import train
+
+    hyperparameters = {k: v for k, v in config.items() if k in AGENT_KEYS}
+    rewards = {k: v for k, v in config.items() if k not in AGENT_KEYS}
+    start = time.perf_counter()
+    stats = train(n_games, seed=seed, save=False, hyperparameters=hyperparameters, rewards=rewards).stats
+    return dict(config, seed=seed, record=stats.record, mean_score=stats.mean_score,
+                max_iteration=stats.max_iteration, avg_iteration=stats.avg_iteration,
+                seconds=time.perf_counter() - start)
+
+
+def sweep(configs, seeds=(0,), n_games=250, workers=None, threads=1, out=None):
+    """
+    Run every configuration with every seed in a process pool
+    :param configs: list[dict]
+    :param seeds: list[int]
+    :param n_games: int
+    :param workers: int, defaults to the number of CPUs divided by threads
+    :param threads: int, torch and BLAS threads per worker
+    :param out: str, CSV to append each finished run to
+    :return: list[dict] of runs, in the order they finished
+    """
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) // threads)
+    names = list(dict.fromkeys(k for config in configs for k in config))
+    fields = ['config'] + names + ['seed'] + METRICS + ['seconds']
+    runs = []
+    with ProcessPoolExecutor(workers, mp_context=mp.get_context('spawn'), initializer=limit_threads,
+                             initargs=(threads,)) as pool:
+        futures = {pool.submit(run_config, config, seed, n_games): i
+                   for i, config in enumerate(configs) for seed in seeds}
+        for future in as_completed(futures):
+            run = dict(future.result(), config=futures[future])
+            runs.append(run)
+            print(f"config {run['config']:3d} seed {run['seed']:3d}: record {run['record']:3d}, "
+                  f"mean {run['mean_score']:.2f} ({run['seconds']:.0f} s)", flush=True)
+            if out:
+                new = not os.path.exists(out)
+                with open(out, 'a', newline='') as f:
+                    writer = csv.DictWriter(f, fields, extrasaction='ignore')
+                    if new:
+                        writer.writeheader()
+                    writer.writerow(run)
+    return runs
+
+
+def summarize(configs, runs):
+    """
+    Average the metrics of each configuration over its seeds, best mean score first
+    :param configs: list[dict]
+    :param runs: list[dict] returned by sweep()
+    :return: list[dict]
+    """
+    table = []
+    for i, config in enumerate(configs):
+        own = [run for run in runs if run['config'] == i]
+        if own:
+            row = dict(config, config=i, seeds=len(own))
+            for metric in METRICS:
+                row[metric] = sum(run[metric] for run in own) / len(own)
+            table.append(row)
+    return sorted(table, key=lambda row: row['mean_score'], reverse=True)
+
+
+def print_table(table):
+    names = [k for k in table[0] if k not in METRICS + ['config', 'seeds']] if table else []
+    print(' '.join(f'{name:>14s}' for name in ['config'] + names + ['seeds'] + METRICS))
+    for row in table:
+        cells = [row['config']] + [row[name] for name in names] + [row['seeds']] + [row[m] for m in METRICS]
+        print(' '.join(f'{c:>14.4g}' if isinstance(c, float) else f'{c!s:>14s}' for c in cells))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Train every configuration of a hyperparameter grid or random search with several seeds in '
+                    'parallel. The spec is a JSON object of parameter name to list of values, e.g. '
+                    '{"lr": [0.001, 0.0005], "gamma": [0.5, 0.9], "food": [10, 20]}. Parameters are the keyword '
+                    'arguments of Agent() (lr, batch_size, max_memory, gamma, epsilon_start, update_every, n_step, '
+                    'training_gap, observation) and the rewards of '
+                    'game.REWARDS (food, death, idle, smoothness).')
+    parser.add_argument('spec', help='JSON file or JSON string')
+    parser.add_argument('--samples', type=int, help='random search with this many configurations instead of a grid')
+    parser.add_argument('--seeds', type=int, default=3, help='seeds per configuration')
+    parser.add_argument('--games', type=int, default=250)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads', type=int, default=1, help='threads per worker')
+    parser.add_argument('--out', default='results/sweep.csv', help='CSV of every run')
+    args = parser.parse_args()
+
+    if os.path.exists(args.spec):
+        with open(args.spec) as f:
+            spec = json.load(f)
+    else:
+        spec = json.loads(args.spec)
+    unknown = [name for name in spec if name not in AGENT_KEYS + ['food', 'death', 'idle', 'smoothness']]
+    if unknown:
+        parser.error(f'unknown parameters {unknown}')
+
+    configs = random_search(spec, args.samples) if args.samples else grid(spec)
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    runs = sweep(configs, range(args.seeds), args.games, args.workers, args.threads, args.out)
+    print_table(summarize(configs, runs))
@@ -0,0 +1,33 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# a 12x16 cell board keeps the generated smoothness graphs small
+ROWS, COLS = 12, 16
+W, H = COLS * 20, ROWS * 20
+
+
+@pytest.fixture(scope='session')
+def tables_dir(tmp_path_factory):
+    """
+    Directory holding smoothness graphs for a ROWS x COLS board, as written by smoothnessGenerate.py
+    """
+    from smoothnessGenerate import generate
+    from smoothness_tables import write_tables
+
+    directory = tmp_path_factory.mktemp('tables')
+    ratings, walls = generate(ROWS, COLS, processes=1)
+    write_tables(ratings, walls, str(directory / 'smoothnessGraphs.txt'), {'generated': {'rows': ROWS, 'cols': COLS}})
+    return directory
+
+
+@pytest.fixture
+def board(tables_dir, monkeypatch):
+    """
+    Run the test in tables_dir, where SnakeGameAI(W, H) finds its smoothness graphs
+    :return: tuple[int, int] of W and H
+    """
+    monkeypatch.chdir(tables_dir)
+    return W, H
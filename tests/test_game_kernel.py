@@ -0,0 +1,33 @@
+import random
+import numpy as np
+import pytest
+from game import SnakeGameAI
+from game_kernel import CompiledSnakeGame
+from state_encoder import encode_state
+
+MOVES = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+
+
+@pytest.mark.parametrize('rewards', [None, {'smoothness': 10}])
+def test_compiled_game_matches_snake_game(board, rewards):
+    games = SnakeGameAI(*board, rewards=rewards), CompiledSnakeGame(*board, rewards=rewards)
+    moves = random.Random(0)
+    state = np.zeros(11, dtype=np.float32)
+    eaten = 0
+    for seed in range(20):
+        for game in games:
+            game.reset(seed)
+        done = False
+        while not done:
+            # random moves that avoid danger when they can, so the snakes grow
+            safe = [i for i in range(3) if not encode_state(games[0], state)[i]] or [0]
+            move = MOVES[moves.choice(safe)]
+            (reward, done, score), compiled = (game.play_step(move) for game in games)
+            assert (reward, done, score) == compiled
+            python, fast = games
+            assert (python.head, python.direction, python.food) == (fast.head, fast.direction, fast.food)
+            assert list(python.snake) == list(fast.snake)
+            np.testing.assert_array_equal(python.grid, fast.grid)
+            assert python.frame_iteration == fast.frame_iteration
+        eaten += games[0].score
+    assert eaten > 0
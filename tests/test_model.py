@@ -0,0 +1,46 @@
+import copy
+import numpy as np
+import torch
+from model import Linear_QNet, QTrainer
+
+
+def _trainers(seed=0):
+    torch.manual_seed(seed)
+    model = Linear_QNet(11, 256, 3)
+    return QTrainer(model, lr=0.001, gamma=0.9), QTrainer(copy.deepcopy(model), lr=0.001, gamma=0.9)
+
+
+def _batch(n, seed=0):
+    rng = np.random.default_rng(seed)
+    states = rng.integers(0, 2, (n, 11))
+    next_states = rng.integers(0, 2, (n, 11))
+    actions = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+    actions = [actions[i] for i in rng.integers(0, 3, n)]
+    rewards = list(rng.choice([-10.0, -0.3, 0.7, 10.0], n))
+    dones = list(rng.random(n) < 0.2)
+    return states, actions, rewards, next_states, dones
+
+
+def _assert_same(batched, reference):
+    assert abs(batched.last_loss - reference.last_loss) <= 1e-6 * max(1.0, abs(reference.last_loss))
+    for p, q in zip(batched.model.parameters(), reference.model.parameters()):
+        torch.testing.assert_close(p, q, rtol=1e-5, atol=1e-6)
+
+
+def test_train_step_matches_reference_on_a_batch():
+    batched, reference = _trainers()
+    for step in range(3):
+        batch = _batch(64, seed=step)
+        td_batched = batched.train_step(*batch)
+        td_reference = reference.train_step_reference(*batch)
+        torch.testing.assert_close(td_batched, td_reference, rtol=1e-5, atol=1e-5)
+        _assert_same(batched, reference)
+
+
+def test_train_step_matches_reference_on_one_transition():
+    batched, reference = _trainers(1)
+    states, actions, rewards, next_states, dones = _batch(4, seed=1)
+    for i in range(4):
+        batched.train_step(states[i], actions[i], rewards[i], next_states[i], dones[i])
+        reference.train_step_reference(states[i], actions[i], rewards[i], next_states[i], dones[i])
+        _assert_same(batched, reference)
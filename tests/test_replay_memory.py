@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from replay_memory import SumTree, PrioritizedReplayMemory
+
+
+def test_sum_tree_find_matches_prefix_sums():
+    rng = np.random.default_rng(0)
+    tree = SumTree(37)
+    priorities = rng.random(37)
+    tree.update(np.arange(37), priorities)
+    # single updates and batch updates keep the same sums
+    for i in rng.integers(0, 37, 20):
+        priorities[i] = rng.random()
+        tree.set(i, priorities[i])
+    assert tree.total == pytest.approx(priorities.sum())
+    values = rng.random(1000) * tree.total
+    # a value falls in the leaf whose prefix-sum interval (a, b] contains it
+    expected = np.searchsorted(np.cumsum(priorities), values)
+    np.testing.assert_array_equal(tree.find(values), expected)
+
+
+def test_prioritized_sampling_is_proportional():
+    n = 8
+    memory = PrioritizedReplayMemory(16, 2, alpha=0.6, seed=0)
+    memory.extend(np.zeros((n, 2)), np.zeros(n), np.zeros(n), np.zeros((n, 2)), np.zeros(n, dtype=bool))
+    td_errors = np.arange(1, n + 1, dtype=np.float64)
+    memory.update_priorities(np.arange(n), td_errors)
+    priorities = (td_errors + memory.eps) ** memory.alpha
+    expected = priorities / priorities.sum()
+
+    counts = np.zeros(n)
+    draws = 0
+    for _ in range(4000):
+        beta = memory.beta
+        _, idx, weights = memory.sample_weighted(4)
+        counts += np.bincount(idx, minlength=n)
+        draws += len(idx)
+        # importance-sampling weights follow (n * P(i)) ** -beta, normalised by their maximum
+        w = (n * expected[idx]) ** -beta
+        np.testing.assert_allclose(weights.numpy(), w / w.max(), rtol=1e-5)
+    np.testing.assert_allclose(counts / draws, expected, atol=0.01)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from scheduler import UpdateScheduler
+
+GAMMA = 0.5
+
+
+class RecordingTrainer:
+    """
+    Keeps the batches UpdateScheduler trains on, one row per transition
+    """
+
+    def __init__(self):
+        self.rows = []
+
+    def train_batch(self, state, action, reward, next_state, done, discounts=None):
+        if discounts is None:
+            discounts = np.full(len(action), GAMMA, dtype=np.float32)
+        for row in zip(state[:, 0].numpy(), reward.numpy(), next_state[:, 0].numpy(), done.numpy(),
+                       np.asarray(discounts)):
+            self.rows.append(tuple(float(x) for x in row))
+
+
+def _games(seed=0, n_games=4):
+    """
+    :return: list[list[tuple[float, bool]]] of the reward and done of each frame of each game
+    """
+    rng = np.random.default_rng(seed)
+    games = []
+    for _ in range(n_games):
+        n = int(rng.integers(1, 30))
+        games.append([(float(rng.choice([-0.3, 0.7, 10.0])), i == n - 1) for i in range(n)])
+    return games
+
+
+def _brute_force(games, n_step):
+    """
+    Each frame's n-step return, summed frame by frame, bootstrapped from the next state of the last frame it covers
+    """
+    rows = []
+    frame = 0
+    for game in games:
+        for t in range(len(game)):
+            m = min(n_step, len(game) - t)
+            ret = sum(GAMMA ** k * game[t + k][0] for k in range(m))
+            last = frame + t + m - 1
+            rows.append((frame + t, ret, last + 1000, float(game[t + m - 1][1]), GAMMA ** m))
+        frame += len(game)
+    return rows
+
+
+@pytest.mark.parametrize('every', [1, 2, 5])
+@pytest.mark.parametrize('n_step', [1, 3, 5])
+def test_n_step_returns_match_brute_force(every, n_step):
+    games = _games()
+    trainer = RecordingTrainer()
+    scheduler = UpdateScheduler(trainer, state_size=1, every=every, n_step=n_step, gamma=GAMMA, gap=False)
+    frame = 0
+    for game in games:
+        for reward, done in game:
+            # states carry their frame number, next states the frame number + 1000
+            scheduler.push(np.array([frame]), frame % 3, reward, np.array([frame + 1000]), done)
+            frame += 1
+    assert scheduler.size == 0
+    expected = _brute_force(games, n_step)
+    assert len(trainer.rows) == len(expected)
+    for row, want in zip(trainer.rows, expected):
+        assert row == pytest.approx(want, rel=1e-5, abs=1e-6)
@@ -0,0 +1,37 @@
+import random
+import numpy as np
+from agent import Agent
+from game import SnakeGameAI, CLOCK_WISE_INDEX, GRID_PAD, norm
+from state_encoder import STATE_SIZE, StateEncoder, encode_state
+
+MOVES = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+
+
+def test_encode_state_matches_get_state(board):
+    game = SnakeGameAI(*board, seed=0)
+    moves = random.Random(0)
+    out = np.zeros(STATE_SIZE, dtype=np.float32)
+    for _ in range(2000):
+        np.testing.assert_array_equal(encode_state(game, out), Agent.get_state(game))
+        _, done, _ = game.play_step(MOVES[moves.randrange(3)])
+        if done:
+            # the state after a fatal move is encoded too
+            np.testing.assert_array_equal(encode_state(game, out), Agent.get_state(game))
+            game.reset()
+
+
+def test_state_encoder_matches_get_state(board):
+    games = [SnakeGameAI(*board, seed=i) for i in range(8)]
+    encoder = StateEncoder(len(games), games[0].rows, games[0].cols, pad=GRID_PAD)
+    out = np.zeros((len(games), STATE_SIZE), dtype=np.float32)
+    moves = random.Random(1)
+    for _ in range(500):
+        grids = np.stack([game.grid for game in games])
+        heads = np.array([[norm(game.head.y), norm(game.head.x)] for game in games])
+        directions = np.array([CLOCK_WISE_INDEX[game.direction] for game in games])
+        food = np.array([[norm(game.food.y), norm(game.food.x)] for game in games])
+        encoder.encode(grids, heads, directions, food, out)
+        np.testing.assert_array_equal(out, np.stack([Agent.get_state(game) for game in games]))
+        for game in games:
+            if game.play_step(MOVES[moves.randrange(3)])[1]:
+                game.reset()
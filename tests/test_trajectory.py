@@ -0,0 +1,45 @@
+import random
+from game import SnakeGameAI
+from trajectory import TrajectoryRecorder, read_episodes, replay
+
+MOVES = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+REWARDS = {'food': 12, 'smoothness': 10}
+
+
+def _record(path, board, seeds, first_game=0, resume=False):
+    recorder = TrajectoryRecorder(path, REWARDS, first_game, resume=resume)
+    game = SnakeGameAI(*board, rewards=REWARDS)
+    moves = random.Random(first_game)
+    for seed in seeds:
+        game.reset(seed)
+        recorder.begin(game)
+        done = False
+        while not done:
+            move = MOVES[moves.randrange(3)]
+            reward, done, score = game.play_step(move)
+            recorder.record(move, reward)
+        recorder.end(score)
+    recorder.close()
+
+
+def test_replay_uses_the_recorded_rewards(board, tmp_path):
+    path = str(tmp_path / 'run.trj')
+    _record(path, board, range(4))
+    episodes = read_episodes(path)
+    assert [e.seed for e in episodes] == list(range(4))
+    for episode in episodes:
+        replay(episode)
+
+
+def test_resume_keeps_the_episodes_before_the_checkpoint(board, tmp_path):
+    path = str(tmp_path / 'run.trj')
+    _record(path, board, range(6))
+    before = read_episodes(path)
+    # continue from game 3, as a run resumed from a checkpoint taken after 3 games
+    _record(path, board, range(10, 13), first_game=3, resume=True)
+    episodes = read_episodes(path)
+    assert [e.seed for e in episodes] == [0, 1, 2, 10, 11, 12]
+    for old, new in zip(before[:3], episodes):
+        assert (old.actions == new.actions).all()
+    for episode in episodes:
+        replay(episode)
@@ -0,0 +1,36 @@
+import random
+import numpy as np
+import pytest
+from game import SnakeGameAI, CLOCK_WISE_INDEX, norm
+from state_encoder import encode_state
+from vec_game import VecSnakeGame
+
+MOVES = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+
+
+@pytest.mark.parametrize('rewards', [None, {'smoothness': 10}])
+def test_vec_game_matches_snake_game(board, rewards):
+    game = SnakeGameAI(*board, rewards=rewards)
+    vec = VecSnakeGame(1, *board, rewards=rewards)
+    moves = random.Random(0)
+    state = np.zeros(11, dtype=np.float32)
+    eaten = 0
+    for seed in range(20):
+        game.reset(seed)
+        done = False
+        while not done:
+            # the two games draw their food differently, so VecSnakeGame gets SnakeGameAI's
+            vec.food[0] = norm(game.food.y), norm(game.food.x)
+            # random moves that avoid danger when they can, so the snakes grow
+            safe = [i for i in range(3) if not encode_state(game, state)[i]] or [0]
+            action = moves.choice(safe)
+            reward, done, score = game.play_step(MOVES[action])
+            vec_rewards, dones, scores = vec.step(np.array([action]))
+            assert vec_rewards[0] == pytest.approx(reward, abs=1e-9)
+            assert (dones[0], scores[0]) == (done, score)
+            if not done:
+                assert tuple(vec.head[0]) == (norm(game.head.y), norm(game.head.x))
+                assert vec.direction[0] == CLOCK_WISE_INDEX[game.direction]
+                assert vec.length[0] == len(game.snake)
+        eaten += score
+    assert eaten > 0
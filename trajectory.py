@@ -0,0 +1,232 @@
+import os
+import struct
+from array import array
+import numpy as np
+
+# file: MAGIC, HEADER, then one record per episode: EPISODE header, actions packed 4 per byte, float32 rewards and
+# done flags packed 8 per byte. Every game state of an episode follows from its seed, actions and the reward settings
+# in HEADER, see replay(). Version 1 files have no HEADER and were recorded with the default rewards.
+MAGIC = b'SNAKETRJ\x02'
+MAGIC_V1 = b'SNAKETRJ\x01'
+REWARD_KEYS = ('food', 'death', 'idle', 'smoothness')
+HEADER = struct.Struct('<4dI')  # game.REWARDS values in REWARD_KEYS order, games played before the first episode
+EPISODE = struct.Struct('<qHHII')  # seed, width, height, frames, score
+
+
+def _pack_actions(actions):
+    """
+    :param actions: ndarray[uint8] of action indices (0, 1 or 2)
+    :return: bytes, 2 bits per action
+    """
+    padded = np.zeros(-(-len(actions) // 4) * 4, dtype=np.uint8)
+    padded[:len(actions)] = actions
+    quads = padded.reshape(-1, 4)
+    return (quads[:, 0] | quads[:, 1] << 2 | quads[:, 2] << 4 | quads[:, 3] << 6).astype(np.uint8).tobytes()
+
+
+def _unpack_actions(data, n):
+    packed = np.frombuffer(data, dtype=np.uint8)
+    return (packed[:, None] >> np.array([0, 2, 4, 6], dtype=np.uint8) & 3).reshape(-1)[:n]
+
+
+class Episode:
+
+    def __init__(self, seed, w, h, score, actions, rewards, dones, reward_settings=None):
+        """
+        A recorded game
+        :param seed: int, passed to SnakeGameAI.reset() at the start of the game
+        :param w: int
+        :param h: int
+        :param score: int
+        :param actions: ndarray[uint8] of action indices
+        :param rewards: ndarray[float32]
+        :param dones: ndarray[bool]
+        :param reward_settings: dict, the rewards argument of SnakeGameAI() the game was played with
+        """
+        self.seed = seed
+        self.w = w
+        self.h = h
+        self.score = score
+        self.actions = actions
+        self.rewards = rewards
+        self.dones = dones
+        self.reward_settings = reward_settings
+
+    def __len__(self):
+        return len(self.actions)
+
+
+class TrajectoryRecorder:
+
+    def __init__(self, path, rewards=None, first_game=0, resume=False):
+        """
+        Appends episodes to a trajectory file. Recording a frame appends two numbers to Python arrays, and the episode
+        is packed and written in one go when it ends.
+        When resuming, the episodes of an existing file from game first_game on are dropped and recording continues
+        after the ones before it, so a run resumed from a checkpoint keeps the games recorded up to that checkpoint.
+        :param path: str
+        :param rewards: dict, overrides of game.REWARDS the games are played with
+        :param first_game: int, games played before the first recorded one
+        :param resume: bool, continue an existing file from first_game instead of starting a new one
+        """
+        from game import REWARDS
+
+        settings = dict(REWARDS, **(rewards or {}))
+        if resume and os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            file_settings, file_first_game, ends = _parse(data, path)
+            if file_settings != settings:
+                raise ValueError(f'{path} was recorded with rewards {file_settings}, not {settings}')
+            kept = first_game - file_first_game
+            if not 0 <= kept <= len(ends):
+                raise ValueError(f'{path} holds games {file_first_game} to {file_first_game + len(ends)}, '
+                                 f'so it cannot be continued from game {first_game}')
+            self.file = open(path, 'r+b')
+            self.file.truncate(ends[kept - 1] if kept else len(MAGIC) + HEADER.size)
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file = open(path, 'wb')
+            self.file.write(MAGIC)
+            self.file.write(HEADER.pack(*(settings[k] for k in REWARD_KEYS), first_game))
+        self.seed = None
+        self.w = self.h = 0
+        self.actions = array('B')
+        self.rewards = array('f')
+
+    def begin(self, game):
+        """
+        Start recording a game that has just been reset with a seed
+        :param game: SnakeGameAI()
+        """
+        if game.seed is None:
+            raise ValueError('only games reset with a seed can be replayed')
+        self.seed = game.seed
+        self.w, self.h = game.w, game.h
+        del self.actions[:]
+        del self.rewards[:]
+
+    def record(self, action, reward):
+        """
+        :param action: list[int] one-hot move or int index
+        :param reward: float
+        """
+        self.actions.append(action.index(1) if isinstance(action, list) else action)
+        self.rewards.append(reward)
+
+    def end(self, score):
+        """
+        Write the episode recorded since begin()
+        :param score: int
+        """
+        n = len(self.actions)
+        dones = np.zeros(n, dtype=bool)
+        dones[-1:] = True
+        self.file.write(EPISODE.pack(self.seed, self.w, self.h, n, score))
+        self.file.write(_pack_actions(np.frombuffer(self.actions, dtype=np.uint8)))
+        self.file.write(self.rewards.tobytes())
+        self.file.write(np.packbits(dones).tobytes())
+
+    def close(self):
+        self.file.close()
+
+
+def _parse(data, path, episodes=None):
+    """
+    :param data: bytes of a trajectory file
+    :param path: str, for the error message
+    :param episodes: list to append the Episode()s to, or None to only find where they end
+    :return: tuple[dict, int, list[int]] of the reward settings, the games played before the first episode and the
+    offset of the end of each episode
+    """
+    from game import REWARDS
+
+    if data.startswith(MAGIC):
+        values = HEADER.unpack_from(data, len(MAGIC))
+        settings = dict(zip(REWARD_KEYS, values[:-1]))
+        first_game = values[-1]
+        offset = len(MAGIC) + HEADER.size
+    elif data.startswith(MAGIC_V1):
+        settings, first_game, offset = dict(REWARDS), 0, len(MAGIC_V1)
+    else:
+        raise ValueError(f'{path} is not a trajectory file')
+    ends = []
+    while offset < len(data):
+        seed, w, h, n, score = EPISODE.unpack_from(data, offset)
+        offset += EPISODE.size
+        if episodes is not None:
+            actions = _unpack_actions(data[offset:offset + -(-n // 4)], n)
+            rewards = np.frombuffer(data, dtype=np.float32, count=n, offset=offset + -(-n // 4))
+            dones = np.frombuffer(data, dtype=np.uint8, count=-(-n // 8), offset=offset + -(-n // 4) + 4 * n)
+            dones = np.unpackbits(dones)[:n].astype(bool)
+            episodes.append(Episode(seed, w, h, score, actions, rewards, dones, settings))
+        offset += -(-n // 4) + 4 * n + -(-n // 8)
+        ends.append(offset)
+    return settings, first_game, ends
+
+
+def read_episodes(path):
+    """
+    :param path: str, file written by TrajectoryRecorder
+    :return: list[Episode]
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    episodes = []
+    _parse(data, path, episodes)
+    return episodes
+
+
+def replay(episode, frame=None, game=None, check=True):
+    """
+    Rebuild the game of an episode as it was after a given number of moves, by replaying the recorded actions
+    :param episode: Episode()
+    :param frame: int, number of moves to replay, all of them if None
+    :param game: SnakeGameAI() of the episode's size and reward settings to reuse, e.g. a visual one to watch the
+    replay
+    :param check: bool, raise if a reward or the end of the game differs from the recording
+    :return: SnakeGameAI()
+    """
+    from game import SnakeGameAI
+
+    if game is None:
+        game = SnakeGameAI(episode.w, episode.h, rewards=episode.reward_settings)
+    game.reset(episode.seed)
+    moves = [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+    n = len(episode) if frame is None else frame
+    for i in range(n):
+        reward, done, _ = game.play_step(moves[episode.actions[i]])
+        # rewards are stored as float32
+        if check and (np.float32(reward) != episode.rewards[i] or done != episode.dones[i]):
+            raise RuntimeError(f'replay of frame {i + 1} differs from the recording')
+    return game
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Inspect or replay a recorded trajectory file')
+    parser.add_argument('path')
+    parser.add_argument('--episode', type=int, help='index of the episode to replay, list the episodes if omitted')
+    parser.add_argument('--frame', type=int, help='stop after this many frames')
+    parser.add_argument('--visual', action='store_true', help='watch the replay')
+    parser.add_argument('--speed', type=int, default=20, help='frames per second of a visual replay')
+    args = parser.parse_args()
+
+    episodes = read_episodes(args.path)
+    if args.episode is None:
+        for i, episode in enumerate(episodes):
+            print(f'{i:5d}  seed {episode.seed:20d}  frames {len(episode):6d}  score {episode.score:4d}  '
+                  f'reward {episode.rewards.sum():9.1f}')
+    else:
+        from game import SnakeGameAI
+
+        episode = episodes[args.episode]
+        game = SnakeGameAI(episode.w, episode.h, speed=args.speed, visual=args.visual,
+                           rewards=episode.reward_settings)
+        start = time.perf_counter()
+        replay(episode, args.frame, game)
+        elapsed = time.perf_counter() - start
+        frames = len(episode) if args.frame is None else args.frame
+        print(f'replayed {frames} frames in {elapsed:.3f} s, score {game.score}')
@@ -0,0 +1,211 @@
+import numpy as np
+from game import BLOCK_SIZE, REWARDS, CLOCK_WISE_DELTAS
+from smoothness_tables import load_smoothness_tables
+
+# change of clockwise index for [straight, right, left]
+TURNS = np.array([0, 1, -1])
+
+
+class VecSnakeGame:
+
+    def __init__(self, n_games, w=640, h=480, seed=None, smoothness_graphs=None, rewards=None):
+        """
+        Batch of n_games SnakeGameAI boards stored as NumPy arrays and stepped together.
+        Cells are (row, col) integers. The body of each game is a ring buffer, and the occupancy grid has a one cell
+        wall border so that a single lookup detects both wall and tail collisions.
+        :param n_games: int
+        :param w: int
+        :param h: int
+        :param seed: int
+        :param smoothness_graphs: tuple[ndarray, ndarray] as returned by load_smoothness_tables()
+        :param rewards: dict, overrides of game.REWARDS
+        """
+        self.n_games = n_games
+        self.w = w
+        self.h = h
+        self.cols = w // BLOCK_SIZE
+        self.rows = h // BLOCK_SIZE
+        self.rng = np.random.default_rng(seed)
+        rewards = dict(REWARDS, **(rewards or {}))
+        self.food_reward = rewards['food']
+        self.death_reward = rewards['death']
+        self.idle_reward = rewards['idle']
+        self.smoothness_reward = rewards['smoothness']
+
+        if smoothness_graphs is None:
+            smoothness_graphs = load_smoothness_tables()
+        ratings, walls = smoothness_graphs
+        if ratings.shape[0] < self.rows or ratings.shape[1] < self.cols:
+            raise ValueError(f'smoothness graphs of size {ratings.shape[:2]} do not cover a '
+                             f'{self.rows}x{self.cols} board')
+        # keep only the part of the tables on the board, flattened over the rated cell
+        self.smoothnessRatings = np.ascontiguousarray(
+            ratings[:self.rows, :self.cols, :, :self.rows, :self.cols]).reshape(self.rows, self.cols, 4, -1)
+        self.minDistToWall = walls[:self.rows, :self.cols].astype(np.int64)
+
+        n = n_games
+        self.capacity = self.rows * self.cols
+        self._games = np.arange(n)
+        self.body = np.zeros((n, self.capacity, 2), dtype=np.int64)
+        self.head_idx = np.zeros(n, dtype=np.int64)
+        self.length = np.zeros(n, dtype=np.int64)
+        self.grid = np.ones((n, self.rows + 2, self.cols + 2), dtype=np.uint8)
+        self.direction = np.zeros(n, dtype=np.int64)  # index into CLOCK_WISE_DELTAS
+        self.food = np.zeros((n, 2), dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.frame_iteration = np.zeros(n, dtype=np.int64)
+        self.frame_timeout_period = np.zeros(n, dtype=np.int64)
+        self.max_iteration = np.zeros(n, dtype=np.int64)
+        self.total_iteration = np.zeros(n, dtype=np.int64)
+
+        self.reset()
+
+    @property
+    def head(self):
+        """
+        :return: ndarray of shape (n_games, 2)
+        """
+        return self.body[self._games, self.head_idx]
+
+    def reset(self, mask=None):
+        """
+        Restart the games selected by mask (all games if mask is None)
+        :param mask: ndarray[bool]
+        """
+        idx = self._games if mask is None else np.flatnonzero(mask)
+        if len(idx) == 0:
+            return
+
+        self.max_iteration[idx] = np.maximum(self.frame_iteration[idx], self.max_iteration[idx])
+        self.total_iteration[idx] += self.frame_iteration[idx]
+        self.frame_iteration[idx] = 0
+        self.frame_timeout_period[idx] = 0
+        self.score[idx] = 0
+        self.direction[idx] = 0
+
+        # same start as SnakeGameAI.reset(): head in the middle, two segments to its left, facing right
+        head_row = int((self.h / 2) // BLOCK_SIZE)
+        head_col = int((self.w / 2) // BLOCK_SIZE)
+        self.grid[idx, 1:-1, 1:-1] = 0
+        for i in range(3):
+            self.body[idx, i] = (head_row, head_col - 2 + i)
+            self.grid[idx, head_row + 1, head_col - 1 + i] = 1
+        self.head_idx[idx] = 2
+        self.length[idx] = 3
+
+        self._place_food(idx)
+
+    def _place_food(self, idx):
+        """
+        Place food uniformly on a free cell of each selected game
+        :param idx: ndarray[int]
+        :return: ndarray[bool] marking the games whose board is full
+        """
+        free = self.grid[idx, 1:-1, 1:-1].reshape(len(idx), -1) == 0
+        keys = self.rng.random(free.shape)
+        keys[~free] = -1
+        cell = keys.argmax(axis=1)
+        self.food[idx, 0] = cell // self.cols
+        self.food[idx, 1] = cell % self.cols
+        return ~free.any(axis=1)
+
+    def smoothness_rating(self):
+        """
+        Tail rating and distance to wall of every direction from each game's head, see SnakeGameAI.smoothness_rating()
+        :return: tuple[ndarray, ndarray, ndarray] of shape (n_games, 4): tail ratings, wall distances and valid mask
+        """
+        head = self.head
+        occupied = self.grid[:, 1:-1, 1:-1].reshape(self.n_games, -1)
+        tables = self.smoothnessRatings[head[:, 0], head[:, 1]]
+        tail = np.einsum('ndk,nk->nd', tables, occupied, dtype=np.int64)
+        walls = self.minDistToWall[head[:, 0], head[:, 1]]
+        # facingDirections index of the current direction is (clockwise + 1) % 4, the neck is behind it
+        back = (self.direction + 3) % 4
+        valid = (walls >= 0) & (np.arange(4) != back[:, None])
+        return tail, walls, valid
+
+    def step(self, actions):
+        """
+        Advance every game by one move. Finished games are reset automatically.
+        :param actions: ndarray of [straight, right, left] indices, shape (n_games,), or one-hot rows (n_games, 3)
+        :return: tuple[ndarray, ndarray, ndarray] of rewards, dones and scores (score reached before any reset)
+        """
+        actions = np.asarray(actions)
+        if actions.ndim == 2:
+            actions = actions.argmax(axis=1)
+        games = self._games
+        self.frame_iteration += 1
+        self.frame_timeout_period += 1
+
+        if self.smoothness_reward:
+            tail, walls, valid = self.smoothness_rating()
+
+        # move
+        old_head = self.head
+        self.direction = (self.direction + TURNS[actions]) % 4
+        new_head = old_head + CLOCK_WISE_DELTAS[self.direction]
+        rows, cols = new_head[:, 0], new_head[:, 1]
+
+        # game over, the tail has not moved yet so it still counts as an obstacle
+        collided = self.grid[games, rows + 1, cols + 1] != 0
+        rewards = np.where(collided, float(self.death_reward), 0.0)
+        alive = ~collided
+
+        # timeout strategy
+        length = self.length + 1
+        late = alive & (self.frame_timeout_period > 0.7 * length + 10)
+        rewards[late] -= 0.5 / length[late]
+
+        # idle too long
+        timed_out = alive & (self.frame_timeout_period == 1000)
+        rewards[timed_out] += self.idle_reward
+        moving = alive & ~timed_out
+
+        # insert the new head
+        m = np.flatnonzero(moving)
+        self.head_idx[m] = (self.head_idx[m] + 1) % self.capacity
+        self.body[m, self.head_idx[m]] = new_head[m]
+        self.grid[m, rows[m] + 1, cols[m] + 1] = 1
+        self.length[m] += 1
+
+        ate = moving & (rows == self.food[:, 0]) & (cols == self.food[:, 1])
+        crawled = np.flatnonzero(moving & ~ate)
+
+        # distance reward function based on Wei et al. equation, in pixels as in SnakeGameAI
+        food = self.food[crawled]
+        distance_old = np.hypot(*(old_head[crawled] - food).T) * BLOCK_SIZE
+        distance_new = np.hypot(*(new_head[crawled] - food).T) * BLOCK_SIZE
+        n = length[crawled]
+        rewards[crawled] += 10 * np.log((n + distance_old) / (n + distance_new)) / np.log(n)
+
+        # remove the tail
+        tail_idx = (self.head_idx[crawled] - self.length[crawled] + 1) % self.capacity
+        tail_cell = self.body[crawled, tail_idx]
+        self.grid[crawled, tail_cell[:, 0] + 1, tail_cell[:, 1] + 1] = 0
+        self.length[crawled] -= 1
+
+        won = np.zeros(self.n_games, dtype=bool)
+        eaten = np.flatnonzero(ate)
+        if len(eaten):
+            self.score[eaten] += 1
+            self.frame_timeout_period[eaten] = 0
+            rewards[eaten] += self.food_reward
+            won[eaten] = self._place_food(eaten)
+
+        # smoothness/space rating rewards for the direction that was taken
+        if self.smoothness_reward:
+            taken = (self.direction + 1) % 4
+            rated = moving & valid[games, taken]
+            tail_taken = tail[games, taken]
+            walls_taken = walls[games, taken]
+            for ratings, taken_rating in ((tail, tail_taken), (walls, walls_taken)):
+                lowest = np.where(valid, ratings, np.iinfo(np.int64).max).min(axis=1)
+                highest = np.where(valid, ratings, np.iinfo(np.int64).min).max(axis=1)
+                is_min = rated & (taken_rating == lowest)
+                rewards[is_min] -= self.smoothness_reward
+                rewards[rated & ~is_min & (taken_rating == highest)] += self.smoothness_reward
+
+        dones = collided | timed_out | won
+        scores = self.score.copy()
+        self.reset(dones)
+        return rewards, dones, scores